@@ -4,7 +4,10 @@ Combines BERT analysis with Llama conversational responses
 """
 
 import os
+import re
 import html
+import functools
+import hashlib
 import gradio as gr
 
 #get_type(schema) assumes schema is a dict, but JSON Schema can be a bool (true/false)
@@ -20,15 +23,21 @@ try:
 except Exception:
     pass  # If patch fails, continue; might be different package structure
 
-from transformers import pipeline
+import torch
+from transformers import pipeline, AutoModel, AutoTokenizer, ZeroShotClassificationPipeline
 from groq import Groq
+import httpx
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime
 import database as db
 import threading
 import time
-import sqlite3
+import queue
 import json
+import random
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
 
 # Load environment
 load_dotenv()
@@ -47,18 +56,36 @@ def get_redirect_uri():
     return os.getenv("GOOGLE_REDIRECT_URI") or "http://localhost:7860/login/callback"
 
 
+@functools.lru_cache(maxsize=1)
+def get_auth_url(redirect_uri):
+    """Build the Google sign-in URL once per redirect URI instead of on every page load."""
+    return drive_storage.get_auth_url(redirect_uri)
+
+
+# Login bar HTML, keyed on (oauth configured, logged-in email); rebuilt only when that changes
+_login_html_cache = {"state": None, "html": None}
+
+
 def get_login_html():
     """Return HTML for login bar (right split): link or logged-in message."""
+    state = (bool(_google_oauth_available), _current_user["email"])
+    if _login_html_cache["state"] == state:
+        return _login_html_cache["html"]
     data_note = " Login required for full functionality (for data-related features like weekly wrap, history, etc)."
     if not _google_oauth_available:
-        return '<div id="login-bar" class="login-bar"><span>Sign in not configured on this demo.</span> Your journal is saved in this session only.</div>'
-    if _current_user["email"]:
-        return f'<div id="login-bar" class="login-bar">Logged in as <strong>{html.escape(_current_user["email"])}</strong> — journal data saved to Drive.</div>'
-    try:
-        auth_url = drive_storage.get_auth_url(get_redirect_uri())
-        return f'<div id="login-bar" class="login-bar"><a href="{html.escape(auth_url)}" target="_blank" rel="noopener">Login with Google</a> — save your journal to your Drive.{data_note}</div>'
-    except Exception as e:
-        return f'<div id="login-bar" class="login-bar">Login unavailable: {html.escape(str(e))}.{data_note}</div>'
+        login_html = '<div id="login-bar" class="login-bar"><span>Sign in not configured on this demo.</span> Your journal is saved in this session only.</div>'
+    elif _current_user["email"]:
+        login_html = f'<div id="login-bar" class="login-bar">Logged in as <strong>{html.escape(_current_user["email"])}</strong> — journal data saved to Drive.</div>'
+    else:
+        try:
+            auth_url = get_auth_url(get_redirect_uri())
+            login_html = f'<div id="login-bar" class="login-bar"><a href="{html.escape(auth_url)}" target="_blank" rel="noopener">Login with Google</a> — save your journal to your Drive.{data_note}</div>'
+        except Exception as e:
+            # Not cached, so the next page load retries
+            return f'<div id="login-bar" class="login-bar">Login unavailable: {html.escape(str(e))}.{data_note}</div>'
+    _login_html_cache["state"] = state
+    _login_html_cache["html"] = login_html
+    return login_html
 
 
 def logout_user():
@@ -68,45 +95,25 @@ def logout_user():
     _current_user["upload_cb"] = None
     db.set_db_path(None)
     db.set_after_commit(None)
+    invalidate_stats()
+    invalidate_history()
+    invalidate_wrap()
     return get_login_html(), gr.update(visible=False)
 
 
+# ONNX Runtime sentiment backend (optional): used when optimum[onnxruntime] is installed
+try:
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    _onnx_available = os.getenv("SENTIMENT_ONNX", "1") != "0"
+except Exception:
+    _onnx_available = False
+
+
 # Check Groq API key
 groq_api_key = os.getenv("GROQ_API_KEY")
 if not groq_api_key or groq_api_key == "your_groq_api_key_here":
     raise ValueError("Please set GROQ_API_KEY in .env file")
 
-# Initialize models
-print("Loading AI models...")
-print("Loading sentiment analysis model...")
-
-try:
-    sentiment_analyzer = pipeline(
-        "sentiment-analysis",
-        model="cardiffnlp/twitter-roberta-base-sentiment-latest"
-    )
-    print("Sentiment analyzer loaded successfully")
-except Exception as e:
-    print(f"Failed to load sentiment analyzer: {e}")
-    print("This is usually a temporary HuggingFace API issue. Please try running again.")
-    raise e
-
-print("Loading theme classifier model...")
-
-try:
-    theme_classifier = pipeline(
-        "zero-shot-classification",
-        model="facebook/bart-large-mnli"
-    )
-    print("Theme classifier loaded successfully")
-except Exception as e:
-    print(f"Failed to load theme classifier: {e}")
-    raise e
-
-groq_client = Groq(api_key=groq_api_key)
-
-print("All models loaded successfully!")
-
 # Theme categories
 THEMES = [
     "Work & Career",
@@ -119,38 +126,487 @@ THEMES = [
     "Nature & Outdoors"
 ]
 
+SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+# Exported ONNX graph is cached here so the export only happens once
+SENTIMENT_ONNX_DIR = Path(__file__).parent / "onnx" / "sentiment"
+
+# Theme backend: "embedding" (MiniLM cosine similarity) or "zero-shot" (BART-large-MNLI)
+THEME_CLASSIFIER = os.getenv("THEME_CLASSIFIER", "embedding")
+THEME_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+THEME_MODEL_NAME = "BART + MiniLM" if THEME_CLASSIFIER == "zero-shot" else "MiniLM"
+# In zero-shot mode, entries shorter than this go to the MiniLM classifier instead of BART
+SHORT_ENTRY_WORDS = 30
+# Minimum score for a theme to be shown; the two backends score on different scales
+# (BART: per-label entailment probability, MiniLM: cosine similarity, rarely above ~0.5)
+ZERO_SHOT_THEME_THRESHOLD = 0.3
+EMBEDDING_THEME_THRESHOLD = 0.2
+
+# Use the first CUDA GPU in half precision when present (bf16 on Ampere+), else FP32 on CPU
+DEVICE = 0 if torch.cuda.is_available() else -1
+if DEVICE >= 0:
+    TORCH_DTYPE = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+else:
+    TORCH_DTYPE = torch.float32
+
+if DEVICE >= 0:
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+
+
+def quantize_pipeline(pipe):
+    """Run the pipeline's Linear layers as INT8 GEMMs (CPU only; set QUANTIZE_MODELS=0 to disable)."""
+    if os.getenv("QUANTIZE_MODELS", "1") == "0" or pipe.device.type != "cpu":
+        return pipe
+    pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipe
+
+
+def compile_pipeline(pipe):
+    """torch.compile the pipeline's model for fused kernels (on by default on GPU; COMPILE_MODELS=1/0 to override)."""
+    if os.getenv("COMPILE_MODELS", "1" if DEVICE >= 0 else "0") != "1":
+        return pipe
+    mode = "reduce-overhead" if DEVICE >= 0 else "default"
+    pipe.model = torch.compile(pipe.model, mode=mode, dynamic=True)
+    return pipe
+
+
+class CachedHypothesisZeroShotPipeline(ZeroShotClassificationPipeline):
+    """Zero-shot pipeline that tokenizes each hypothesis once and reuses the ids.
+
+    The stock pipeline re-tokenizes every (premise, "This example is {label}.")
+    pair on each call; here only the premise is tokenized per call.
+    """
+
+    # Cap on premise + hypothesis tokens; attention cost grows quadratically with length
+    max_length = 512
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hypothesis_ids = {}
+
+    def _get_hypothesis_ids(self, hypothesis):
+        ids = self._hypothesis_ids.get(hypothesis)
+        if ids is None:
+            ids = self.tokenizer(hypothesis, add_special_tokens=False)["input_ids"]
+            self._hypothesis_ids[hypothesis] = ids
+        return ids
+
+    def preprocess(self, inputs, candidate_labels=None, hypothesis_template="This example is {}."):
+        sequence_pairs, sequences = self._args_parser(inputs, candidate_labels, hypothesis_template)
+        premise_ids = self.tokenizer(sequences[0], add_special_tokens=False)["input_ids"]
+        special_tokens = self.tokenizer.num_special_tokens_to_add(pair=True)
+
+        for i, (candidate_label, (_, hypothesis)) in enumerate(zip(candidate_labels, sequence_pairs)):
+            hypothesis_ids = self._get_hypothesis_ids(hypothesis)
+            # Same as the stock "only_first" truncation: trim the premise, never the hypothesis
+            max_length = min(self.tokenizer.model_max_length, self.max_length)
+            budget = max_length - len(hypothesis_ids) - special_tokens
+            premise = premise_ids[:budget]
+            input_ids = self.tokenizer.build_inputs_with_special_tokens(premise, hypothesis_ids)
+            model_input = {
+                "input_ids": torch.tensor([input_ids]),
+                "attention_mask": torch.ones(1, len(input_ids), dtype=torch.long),
+            }
+            if "token_type_ids" in self.tokenizer.model_input_names:
+                token_type_ids = self.tokenizer.create_token_type_ids_from_sequences(premise, hypothesis_ids)
+                model_input["token_type_ids"] = torch.tensor([token_type_ids])
+
+            yield {
+                "candidate_label": candidate_label,
+                "sequence": sequences[0],
+                "is_last": i == len(candidate_labels) - 1,
+                **model_input,
+            }
+
+
+class EmbeddingThemeClassifier:
+    """Score themes by cosine similarity between sentence embeddings.
+
+    One small MiniLM forward per text instead of one BART-large forward per
+    (text, label) pair. Label embeddings are computed once per label set.
+    Takes the same arguments and returns the same shape as the zero-shot
+    pipeline, so it can be swapped in for theme_classifier.
+    """
+
+    def __init__(self, model_name, device=-1, torch_dtype=torch.float32, max_length=256):
+        self.device = torch.device(f"cuda:{device}" if device >= 0 else "cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name, torch_dtype=torch_dtype).to(self.device).eval()
+        self.max_length = max_length
+        self._label_embeddings = {}
+
+    def encode(self, texts):
+        """Return L2-normalized mean-pooled embeddings, one row per text."""
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+        ).to(self.device)
+        with torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled.float(), dim=-1)
+
+    def _get_label_embeddings(self, labels):
+        labels = tuple(labels)
+        if labels not in self._label_embeddings:
+            self._label_embeddings[labels] = self.encode(list(labels))
+        return self._label_embeddings[labels]
+
+    def __call__(self, texts, candidate_labels, batch_size=None, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        scores = self.encode(texts) @ self._get_label_embeddings(candidate_labels).T
+
+        results = []
+        for text, row in zip(texts, scores.tolist()):
+            ranked = sorted(zip(candidate_labels, row), key=lambda pair: pair[1], reverse=True)
+            results.append({
+                "sequence": text,
+                "labels": [label for label, _ in ranked],
+                "scores": [score for _, score in ranked],
+            })
+        return results[0] if single else results
+
+
+class LazyModel:
+    """Build a model on first use instead of at import time.
+
+    Calling the LazyModel loads the model (once, thread-safe) and forwards the call.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._loader()
+        return self._model
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+
+def load_onnx_sentiment_model():
+    """Load the ONNX export of the sentiment model, exporting it on first run.
+    ORT fuses attention/LayerNorm; IO binding reuses device buffers on CUDA.
+    """
+    provider = "CUDAExecutionProvider" if DEVICE >= 0 else "CPUExecutionProvider"
+    if SENTIMENT_ONNX_DIR.exists():
+        return ORTModelForSequenceClassification.from_pretrained(
+            SENTIMENT_ONNX_DIR, provider=provider, use_io_binding=DEVICE >= 0
+        )
+    model = ORTModelForSequenceClassification.from_pretrained(
+        SENTIMENT_MODEL, export=True, provider=provider, use_io_binding=DEVICE >= 0
+    )
+    try:
+        model.save_pretrained(SENTIMENT_ONNX_DIR)
+    except Exception as e:
+        # e.g. a read-only app dir: keep the in-memory export, the next process exports again
+        print(f"Could not cache the ONNX export in {SENTIMENT_ONNX_DIR}: {e}")
+    return model
+
+
+def load_sentiment_analyzer():
+    print("Loading sentiment analysis model...")
+    try:
+        analyzer = None
+        if _onnx_available:
+            try:
+                analyzer = pipeline(
+                    "sentiment-analysis",
+                    model=load_onnx_sentiment_model(),
+                    tokenizer=AutoTokenizer.from_pretrained(SENTIMENT_MODEL)
+                )
+            except Exception as e:
+                # Fall back once instead of retrying the export on every chat turn
+                print(f"ONNX sentiment model unavailable, using PyTorch: {e}")
+        if analyzer is None:
+            analyzer = pipeline(
+                "sentiment-analysis",
+                model=SENTIMENT_MODEL,
+                device=DEVICE,
+                torch_dtype=TORCH_DTYPE
+            )
+            quantize_pipeline(analyzer)
+            compile_pipeline(analyzer)
+        print("Sentiment analyzer loaded successfully")
+        return analyzer
+    except Exception as e:
+        print(f"Failed to load sentiment analyzer: {e}")
+        print("This is usually a temporary HuggingFace API issue. Please try running again.")
+        raise e
+
+
+def load_theme_classifier(kind=THEME_CLASSIFIER):
+    print(f"Loading theme classifier model ({kind})...")
+    try:
+        if kind == "zero-shot":
+            classifier = pipeline(
+                "zero-shot-classification",
+                model="facebook/bart-large-mnli",
+                pipeline_class=CachedHypothesisZeroShotPipeline,
+                device=DEVICE,
+                torch_dtype=TORCH_DTYPE
+            )
+        else:
+            classifier = EmbeddingThemeClassifier(THEME_EMBEDDING_MODEL, device=DEVICE, torch_dtype=TORCH_DTYPE)
+        quantize_pipeline(classifier)
+        compile_pipeline(classifier)
+        print("Theme classifier loaded successfully")
+        return classifier
+    except Exception as e:
+        print(f"Failed to load theme classifier: {e}")
+        raise e
+
+
+# Models are loaded on the first analyze_entry call, keeping startup fast and memory low
+sentiment_analyzer = LazyModel(load_sentiment_analyzer)
+theme_classifier = LazyModel(load_theme_classifier)
+
+# One pooled, keep-alive HTTP client shared by every Groq call (chat, weekly wrap, Whisper),
+# multiplexed over HTTP/2 when the h2 package is installed
+try:
+    import h2  # noqa: F401
+    _http2_available = True
+except ImportError:
+    _http2_available = False
+
+groq_client = Groq(
+    api_key=groq_api_key,
+    http_client=httpx.Client(
+        http2=_http2_available,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=60.0),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        follow_redirects=True,
+    ),
+)
+
+print("AI models load on first use (WARMUP_MODELS=1 preloads them in the background)")
+
+# Micro-batching: texts arriving within this window are classified in one forward pass
+BATCH_WINDOW_SECONDS = 0.05
+BATCH_MAX_SIZE = 16
+
+
+class BatchedPipeline:
+    """Collect concurrent calls to a pipeline and run them as a single batch.
+
+    submit() returns a Future (submit_many() a list of them, queued together). A lone
+    request runs immediately; when other requests are already waiting, the worker keeps
+    collecting for up to BATCH_WINDOW_SECONDS (or until BATCH_MAX_SIZE texts) and then
+    calls the pipeline once.
+    """
+
+    def __init__(self, pipe, window=BATCH_WINDOW_SECONDS, max_batch=BATCH_MAX_SIZE, **call_kwargs):
+        self.pipe = pipe
+        self.window = window
+        self.max_batch = max_batch
+        self.call_kwargs = call_kwargs
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts):
+        items = [(text, Future()) for text in texts]
+        self._queue.put(items)
+        return [future for _, future in items]
+
+    def _collect(self):
+        batch = list(self._queue.get())
+        # Nobody else waiting: run now rather than sitting out the window alone
+        if self._queue.empty():
+            return batch
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.extend(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                with torch.inference_mode():
+                    results = self.pipe(texts, batch_size=len(texts), **self.call_kwargs)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+sentiment_batcher = BatchedPipeline(sentiment_analyzer, truncation=True, max_length=256)
+theme_batcher = BatchedPipeline(theme_classifier, candidate_labels=THEMES, multi_label=True)
+
+# Short chat turns don't need BART-large: route them to the small embedding classifier
+if THEME_CLASSIFIER == "zero-shot":
+    short_theme_classifier = LazyModel(functools.partial(load_theme_classifier, "embedding"))
+    short_theme_batcher = BatchedPipeline(short_theme_classifier, candidate_labels=THEMES)
+else:
+    short_theme_classifier = theme_classifier
+    short_theme_batcher = theme_batcher
+
+
+def _theme_route(word_count):
+    """(classifier, batcher) that scores themes for an entry of this many words."""
+    if word_count < SHORT_ENTRY_WORDS:
+        return short_theme_classifier, short_theme_batcher
+    return theme_classifier, theme_batcher
+
+# Dummy-input lengths (in words) used to trigger compilation/autotuning before real traffic
+WARMUP_LENGTHS = (32, 128, 256, 512)
+
+
+def _warmup():
+    """Load the models and run a forward per length bucket so the first real entry is fast."""
+    batchers = [sentiment_batcher, theme_batcher]
+    if short_theme_batcher is not theme_batcher:
+        batchers.append(short_theme_batcher)
+    try:
+        for length in WARMUP_LENGTHS:
+            text = "x " * length
+            for future in [batcher.submit(text) for batcher in batchers]:
+                future.result()
+        print("All models loaded successfully!")
+    except Exception as e:
+        print(f"Model warm-up failed (models will load on first use): {e}")
+
+
+# Opt-in: WARMUP_MODELS=1 loads and warms every model (both theme classifiers in zero-shot mode)
+# in the background, trading the on-demand memory savings for a fast first entry
+if os.getenv("WARMUP_MODELS", "0") == "1":
+    threading.Thread(target=_warmup, daemon=True).start()
+
 def get_sentiment_emoji(label):
     """Get label for sentiment"""
     return ""  # No emojis
 
-def analyze_entry(text):
-    """Analyze journal entry with BERT"""
-    # Sentiment analysis
-    sentiment = sentiment_analyzer(text)[0]
-    
-    # Theme classification
-    theme_result = theme_classifier(
-        text,
-        candidate_labels=THEMES,
-        multi_label=True
-    )
+# Longer entries are split on sentence boundaries; ~180 words fits the 256-token sentiment limit
+MAX_CHUNK_WORDS = 180
+
+
+def split_into_chunks(text, max_words=MAX_CHUNK_WORDS):
+    """Split text into sentence-aligned chunks of at most max_words words."""
+    if len(text.split()) <= max_words:
+        return [text]
+    chunks, current, count = [], [], 0
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        words = len(sentence.split())
+        if current and count + words > max_words:
+            chunks.append(" ".join(current))
+            current, count = [], 0
+        current.append(sentence)
+        count += words
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _average_sentiment(results, weights):
+    """Combine per-chunk sentiment results, weighting each by chunk length."""
+    if len(results) == 1:
+        return results[0]
+    totals = {}
+    for result, weight in zip(results, weights):
+        totals[result['label']] = totals.get(result['label'], 0) + result['score'] * weight
+    label = max(totals, key=totals.get)
+    return {'label': label, 'score': totals[label] / sum(weights)}
+
+
+def _average_themes(results, weights):
+    """Combine per-chunk theme results, weighting each by chunk length."""
+    if len(results) == 1:
+        return results[0]
+    totals = {}
+    for result, weight in zip(results, weights):
+        for label, score in zip(result['labels'], result['scores']):
+            totals[label] = totals.get(label, 0) + score * weight
+    total_weight = sum(weights)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'labels': [label for label, _ in ranked],
+        'scores': [score / total_weight for _, score in ranked]
+    }
+
+
+@functools.lru_cache(maxsize=512)
+def _analyze_normalized(text):
+    """Run both models on whitespace-normalized text; cached so repeated messages skip inference."""
+    chunks = split_into_chunks(text)
+    weights = [len(chunk.split()) for chunk in chunks]
+
+    # Queue both models; concurrent chat turns (and chunks) are batched together
+    sentiment_futures = sentiment_batcher.submit_many(chunks)
+    _, themes_from = _theme_route(sum(weights))
+    theme_futures = themes_from.submit_many(chunks)
+    sentiment = _average_sentiment([f.result() for f in sentiment_futures], weights)
+    theme_result = _average_themes([f.result() for f in theme_futures], weights)
     
-    # Get top 3 themes with score > 0.3
+    # Get top 3 themes above the cutoff for whichever classifier scored them
+    # (short_theme_batcher is always the embedding one, and is theme_batcher in embedding mode)
+    threshold = EMBEDDING_THEME_THRESHOLD if themes_from is short_theme_batcher else ZERO_SHOT_THEME_THRESHOLD
     top_themes = []
     for label, score in zip(theme_result['labels'], theme_result['scores']):
-        if score > 0.3 and len(top_themes) < 3:
+        if score > threshold and len(top_themes) < 3:
             top_themes.append((label, score))
     
+    return sentiment['label'], sentiment['score'], tuple(top_themes)
+
+
+def analyze_entry(text):
+    """Analyze journal entry with BERT"""
+    # Case is kept: the sentiment model reads capitals as emphasis
+    sentiment, sentiment_score, themes = _analyze_normalized(" ".join(text.split()))
     return {
-        'sentiment': sentiment['label'],
-        'sentiment_score': sentiment['score'],
-        'themes': top_themes
+        'sentiment': sentiment,
+        'sentiment_score': sentiment_score,
+        'themes': list(themes)
     }
 
-def generate_response(entry_text, analysis):
-    """Generate empathetic response using Groq/Llama"""
-    themes_str = ", ".join([theme for theme, _ in analysis['themes']]) if analysis['themes'] else "general reflection"
-    sentiment_str = analysis['sentiment'].lower()
+# Used when the models fail to load or run, so the turn is still saved
+_NEUTRAL_ANALYSIS = {'sentiment': 'neutral', 'sentiment_score': 0.0, 'themes': []}
+
+
+def _analysis_result(analysis_future):
+    """Result of a background analyze_entry, or a neutral analysis if the models errored."""
+    try:
+        return analysis_future.result()
+    except Exception as e:
+        print(f"⚠️ Analysis failed, saving without it: {e}")
+        return dict(_NEUTRAL_ANALYSIS, themes=[])
+
+def generate_response(entry_text, analysis=None):
+    """Stream an empathetic response from Groq/Llama, yielding the text so far.
+    analysis is optional; without it the prompt relies on the entry text alone.
+    """
+    analysis_context = ""
+    if analysis:
+        themes_str = ", ".join([theme for theme, _ in analysis['themes']]) if analysis['themes'] else "general reflection"
+        sentiment_str = analysis['sentiment'].lower()
+        analysis_context = f"""
+Context from analysis:
+- Emotional tone: {sentiment_str}
+- Topics they're thinking about: {themes_str}
+"""
     
     system_prompt = """You are Luna, a warm and empathetic journaling companion. You guide users through meaningful self-reflection by adapting to different journaling styles.
 
@@ -201,40 +657,37 @@ Your tone is gentle, encouraging, and genuinely curious about their experience."
     user_prompt = f"""The user just wrote:
 
 "{entry_text}"
-
-Context from analysis:
-- Emotional tone: {sentiment_str}
-- Topics they're thinking about: {themes_str}
-
+{analysis_context}
 Respond with empathy and ask a thoughtful follow-up question that matches their journaling style."""
 
     try:
-        response = groq_client.chat.completions.create(
+        stream = groq_client.chat.completions.create(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             model="llama-3.3-70b-versatile",
             temperature=0.7,
-            max_tokens=200
+            max_tokens=200,
+            stream=True
         )
-        return response.choices[0].message.content
+        response_text = ""
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                response_text += delta
+                yield response_text
     except Exception as e:
-        return f"I'm having trouble connecting right now. Error: {str(e)}"
+        yield f"I'm having trouble connecting right now. Error: {str(e)}"
 
-def format_analysis_display(analysis):
-    """Format analysis for display panel with fancy styling"""
-    
-    # Get sentiment emoji and color
-    sentiment_icons = {
-        'positive': '😊',
-        'negative': '😔',
-        'neutral': '😐'
-    }
-    sentiment_lower = analysis['sentiment'].lower()
-    sentiment_icon = sentiment_icons.get(sentiment_lower, '💭')
-    
-    display = f"""
+_SENTIMENT_ICONS = {
+    'positive': '😊',
+    'negative': '😔',
+    'neutral': '😐'
+}
+
+# Analysis panel markup, filled with str.format_map on every chat turn
+_ANALYSIS_TEMPLATE = """
 <div class="analysis-content">
 
 <div class="analysis-section">
@@ -244,11 +697,11 @@ def format_analysis_display(analysis):
 </div>
 <div class="sentiment-display">
 <span class="sentiment-icon">{sentiment_icon}</span>
-<span class="sentiment-text">{analysis['sentiment']}</span>
+<span class="sentiment-text">{sentiment}</span>
 <div class="confidence-bar-container">
-<div class="confidence-bar" style="width: {analysis['sentiment_score']*100}%"></div>
+<div class="confidence-bar" style="width: {sentiment_pct:.1f}%"></div>
 </div>
-<span class="confidence-text">{analysis['sentiment_score']:.1%} confidence</span>
+<span class="confidence-text">{sentiment_score:.1%} confidence</span>
 </div>
 </div>
 
@@ -260,43 +713,119 @@ def format_analysis_display(analysis):
 <span class="section-title">Themes Detected</span>
 </div>
 <div class="themes-container">
+{themes_html}
+</div>
+</div>
+
+</div>
 """
-    
-    if analysis['themes']:
-        for theme, score in analysis['themes']:
-            display += f"""
+
+_THEME_ROW_TEMPLATE = """
 <div class="theme-item">
-<span class="theme-name">{theme}</span>
+<span class="theme-name">{name}</span>
 <div class="theme-bar-container">
-<div class="theme-bar" style="width: {score*100}%"></div>
+<div class="theme-bar" style="width: {pct:.1f}%"></div>
 </div>
 <span class="theme-score">{score:.0%}</span>
 </div>
 """
-    else:
-        display += '<div class="no-themes">No specific themes detected</div>'
-    
-    display += """
-</div>
-</div>
 
-</div>
-"""
+_NO_THEMES_HTML = '<div class="no-themes">No specific themes detected</div>'
+
+
+def format_analysis_display(analysis):
+    """Format analysis for display panel with fancy styling"""
+    themes_html = "".join(
+        _THEME_ROW_TEMPLATE.format(name=theme, pct=score * 100, score=score)
+        for theme, score in analysis['themes']
+    ) or _NO_THEMES_HTML
     
-    return display
+    return _ANALYSIS_TEMPLATE.format_map({
+        'sentiment_icon': _SENTIMENT_ICONS.get(analysis['sentiment'].lower(), '💭'),
+        'sentiment': analysis['sentiment'],
+        'sentiment_pct': analysis['sentiment_score'] * 100,
+        'sentiment_score': analysis['sentiment_score'],
+        'themes_html': themes_html
+    })
+
+# In-memory mirror of db.get_stats(): loaded once, then updated as messages are saved.
+# "bar"/"sidebar" hold the rendered markdown and are dropped whenever the stats change.
+_stats_cache = {"stats": None, "bar": None, "sidebar": None}
+_stats_lock = threading.Lock()
+
+
+def get_cached_stats():
+    """Return journal stats, querying the database only when the cache is empty."""
+    with _stats_lock:
+        if _stats_cache["stats"] is None:
+            _stats_cache["stats"] = db.get_stats()
+        return _stats_cache["stats"]
+
+
+def invalidate_stats():
+    """Drop cached stats (e.g. after switching between local and Drive databases)."""
+    with _stats_lock:
+        _stats_cache["stats"] = None
+        _stats_cache["bar"] = None
+        _stats_cache["sidebar"] = None
+
+
+def record_message_in_stats(sentiment, sentiment_score, today):
+    """Apply one saved chat message to the cached stats, mirroring get_stats' queries."""
+    with _stats_lock:
+        stats = _stats_cache["stats"]
+        if stats is None:
+            return  # not loaded yet; the next read queries the database, save included
+        if stats["last_entry"] == today:
+            return  # today is already counted; sentiment is only set when the row is created
+    # A mood-only row for today keeps its NULL sentiment when the conversation is appended;
+    # read outside the lock so stats readers don't wait on SQLite
+    mood_only_row = db.get_mood_color_for_today(today) is not None
+    with _stats_lock:
+        stats = _stats_cache["stats"]
+        if stats is None or stats["last_entry"] == today:
+            return  # invalidated or already counted while we were reading
+        stats["total_entries"] += 1
+        stats["last_entry"] = today
+        _stats_cache["bar"] = None
+        _stats_cache["sidebar"] = None
+        if mood_only_row:
+            return
+        label = sentiment.upper()
+        if label == "POSITIVE":
+            count = stats["sentiment_counts"].get(label, 0)
+            stats["avg_positive"] = (stats["avg_positive"] * count + sentiment_score) / (count + 1)
+        stats["sentiment_counts"][label] = stats["sentiment_counts"].get(label, 0) + 1
+
+
+def _cached_render(key, render):
+    """Return the cached markdown for a stats panel, rendering it only after the stats changed."""
+    with _stats_lock:
+        if _stats_cache[key] is None:
+            if _stats_cache["stats"] is None:
+                _stats_cache["stats"] = db.get_stats()
+            _stats_cache[key] = render(_stats_cache["stats"])
+        return _stats_cache[key]
+
 
 def format_stats_bar():
     """Format the left stats bar only (right bar is login, separate component)."""
-    stats = db.get_stats()
+    return _cached_render("bar", _render_stats_bar)
+
+
+def format_stats_sidebar():
+    """Format the stats in the sidebar"""
+    return _cached_render("sidebar", _render_stats_sidebar)
+
+
+def _render_stats_bar(stats):
     return f"""
 <div id="stats-bar-left" class="stats-bar-box">
 <strong>Your Stats:</strong> {stats['total_entries']} days journaled | Last journal date: {stats['last_entry'] or 'Never'}
 </div>
 """
 
-def format_stats_sidebar():
-    """Format the stats in the sidebar"""
-    stats = db.get_stats()
+def _render_stats_sidebar(stats):
     return f"""
 ### Stats
 - Total: {stats['total_entries']}
@@ -310,7 +839,7 @@ def format_stats_sidebar():
 
 ### Powered By
 - RoBERTa (Sentiment)
-- BART (Themes)
+- {THEME_MODEL_NAME} (Themes)
 - Llama 3.3 (Chat)
 - Whisper v3 (Speech-to-Text)
 """
@@ -328,12 +857,14 @@ MOOD_COLORS = {
 def save_mood_color_handler(mood_name):
     """Handler for saving mood color selection"""
     color_hex = MOOD_COLORS[mood_name]['color']
-    db.save_mood_color(f"{mood_name}:{color_hex}")
-    return get_mood_status()
+    today = date.today().isoformat()
+    db.save_mood_color(f"{mood_name}:{color_hex}", today)
+    invalidate_history()
+    return get_mood_status(today)
 
-def get_mood_status():
+def get_mood_status(today=None):
     """Get current mood color status"""
-    saved_color = db.get_mood_color_for_today()
+    saved_color = db.get_mood_color_for_today(today)
     if saved_color:
         mood_name = saved_color.split(':')[0]
         mood_info = MOOD_COLORS.get(mood_name, {})
@@ -348,15 +879,16 @@ def transcribe_audio(audio_path):
         return ""
     
     try:
-        client = Groq(api_key=groq_api_key)
-        
+        # Read the clip once and upload it in a single request on the shared client
         with open(audio_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-large-v3",
-                response_format="text",
-                language="en"
-            )
+            audio_bytes = audio_file.read()
+        
+        transcription = groq_client.audio.transcriptions.create(
+            file=(os.path.basename(audio_path), audio_bytes),
+            model="whisper-large-v3",
+            response_format="text",
+            language="en"
+        )
         
         return transcription
     except Exception as e:
@@ -389,44 +921,122 @@ def _chatbot_history_to_pairs(history):
     return list(history)
 
 
-def chat_interface(message, history):
-    """Main chat function"""
+_EMPTY_ANALYSIS_HTML = """
+<div class="analysis-content">
+<div class="analysis-section">
+<div class="section-header">
+<span class="section-icon">🔮</span>
+<span class="section-title">Analysis Panel</span>
+</div>
+<div style="padding: 30px 20px; text-align: center;">
+<div style="font-size: 16px; color: rgba(255, 255, 255, 0.9); margin-bottom: 10px;">
+<strong>Write your first entry to see the magic!</strong>
+</div>
+<div style="font-size: 14px; color: rgba(255, 255, 255, 0.7); font-style: italic;">
+I'll analyze your:
+</div>
+<div style="margin-top: 15px; display: flex; flex-direction: column; gap: 8px; align-items: center;">
+<div style="color: rgba(255, 255, 255, 0.8);">🎭 Sentiment & Emotions</div>
+<div style="color: rgba(255, 255, 255, 0.8);">🏷️ Themes & Topics</div>
+<div style="color: rgba(255, 255, 255, 0.8);">💭 Emotional Patterns</div>
+</div>
+</div>
+</div>
+</div>
+"""
+
+_WARMING_UP_HTML = """
+<div class="analysis-content">
+<div class="no-themes">Warming up the analysis models... your first entry takes a little longer.</div>
+</div>
+"""
+
+# Runs analyze_entry in the background so the Groq call doesn't wait on the local models
+# Chat turns Gradio runs at once; the analysis pool matches so concurrent turns can share a batch
+CHAT_CONCURRENCY = 4
+_analysis_pool = ThreadPoolExecutor(max_workers=CHAT_CONCURRENCY)
+
+
+# Stats markdown last sent to each browser session, so unchanged panels aren't re-rendered;
+# least recently used sessions are dropped past SENT_STATS_MAX_SESSIONS
+SENT_STATS_MAX_SESSIONS = 256
+_sent_stats = OrderedDict()
+_sent_stats_lock = threading.Lock()
+
+
+def stats_updates(session_hash):
+    """Return (stats bar, sidebar) updates, using a no-op gr.update() for any unchanged panel."""
+    rendered = (format_stats_bar(), format_stats_sidebar())
+    if session_hash is None:
+        return rendered  # no session to remember what was sent; always send both
+    with _sent_stats_lock:
+        previous = _sent_stats.pop(session_hash, (None, None))
+        _sent_stats[session_hash] = rendered
+        if len(_sent_stats) > SENT_STATS_MAX_SESSIONS:
+            _sent_stats.popitem(last=False)
+    return tuple(gr.update() if new == old else new for new, old in zip(rendered, previous))
+
+
+def chat_interface(message, history, request: gr.Request = None):
+    """Main chat function; clears the input box and streams Luna's reply into the chatbot as it arrives"""
+    session_hash = request.session_hash if request else None
     if not message.strip():
         # Ensure we return history in list-of-pairs format for Gradio 4.x
         pairs = _chatbot_history_to_pairs(history) if history else []
-        return pairs, "", load_history(), format_stats_bar(), format_stats_sidebar()
+        yield ("", pairs, "", get_history_view()) + stats_updates(session_hash)
+        return
+    
+    # Analyze the entry in the background while Luna's reply streams
+    analysis_future = _analysis_pool.submit(analyze_entry, message)
+    analysis = None
+    
+    # Gradio 4.x Chatbot expects list of [user_msg, bot_msg] pairs (list of lists/tuples)
+    existing_pairs = _chatbot_history_to_pairs(history) if history else []
+    new_history = existing_pairs + [[message, ""]]
     
-    # Analyze the entry
-    analysis = analyze_entry(message)
+    # Clear the input box and show the message right away; later yields leave the box alone
+    # so anything typed while Luna replies isn't wiped
+    themes_model, _ = _theme_route(len(message.split()))
+    warming_up = not (sentiment_analyzer.loaded and themes_model.loaded)
+    yield "", new_history, _WARMING_UP_HTML if warming_up else gr.update(), gr.update(), gr.update(), gr.update()
     
-    # Generate AI response
-    ai_response = generate_response(message, analysis)
+    # Stream AI response; the analysis panel fills in as soon as analysis is done,
+    # history and stats are refreshed once the reply is complete
+    ai_response = ""
+    for partial in generate_response(message):
+        ai_response = partial
+        new_history[-1][1] = partial
+        analysis_update = gr.update()
+        if analysis is None and analysis_future.done():
+            analysis = _analysis_result(analysis_future)
+            analysis_update = format_analysis_display(analysis)
+        yield gr.update(), new_history, analysis_update, gr.update(), gr.update(), gr.update()
+    
+    if analysis is None:
+        analysis = _analysis_result(analysis_future)
+    analysis_display = format_analysis_display(analysis)
     
     # Save to database (appends to today's entry if exists)
+    # Computed once so the save and the cache updates agree on the day, even around midnight
+    today = date.today().isoformat()
     themes_list = [theme for theme, _ in analysis['themes']]
     entry_id = db.save_conversation_message(
         user_message=message,
         ai_response=ai_response,
         sentiment=analysis['sentiment'],
         sentiment_score=analysis['sentiment_score'],
-        themes=themes_list
+        themes=themes_list,
+        today=today
     )
     
     print(f"💾 Saved to today's journal (entry #{entry_id})")
-    
-    # Format analysis display
-    analysis_display = format_analysis_display(analysis)
-    
-    # Gradio 4.x Chatbot expects list of [user_msg, bot_msg] pairs (list of lists/tuples)
-    existing_pairs = _chatbot_history_to_pairs(history) if history else []
-    new_history = existing_pairs + [[message, ai_response]]
+    record_message_in_stats(analysis['sentiment'], analysis['sentiment_score'], today)
     
     # Also refresh the history view and stats
-    updated_history_view = load_history()
-    updated_stats_bar = format_stats_bar()
-    updated_stats_sidebar = format_stats_sidebar()
+    updated_history_view = append_to_history(entry_id, message, ai_response, analysis, themes_list, today)
+    updated_stats_bar, updated_stats_sidebar = stats_updates(session_hash)
     
-    return new_history, analysis_display, updated_history_view, updated_stats_bar, updated_stats_sidebar
+    yield gr.update(), new_history, analysis_display, updated_history_view, updated_stats_bar, updated_stats_sidebar
 
 # Custom CSS for styling
 custom_css = """
@@ -437,6 +1047,12 @@ custom_css = """
 :root {
     color-scheme: light !important;
     background: #F2ECFF !important;
+    /* Shared gradients: declared once, referenced with var() below */
+    --primary-grad: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    --quit-grad: linear-gradient(135deg, #FFB6C1 0%, #FF91B4 100%);
+    --mic-grad: linear-gradient(135deg, #e8e0f5 0%, #d8d0e8 100%);
+    --bar-grad: linear-gradient(135deg, #7a4a9e 0%, #9b6bb8 100%);
+    --accent-grad: linear-gradient(135deg, #7642a0 0%, #9370DB 100%);
 }
 
 * {
@@ -472,30 +1088,36 @@ body {
     }
 }
 
+/* Fixed layer holding the butterflies/hearts: contained, so their animation never repaints the app */
+#flutter-layer {
+    position: fixed;
+    inset: 0;
+    pointer-events: none;
+    overflow: hidden;
+    contain: layout paint;
+    z-index: 9999;
+}
+
 /* Floating butterflies - glowy white */
 .butterfly {
-    position: fixed;
+    position: absolute;
     font-size: 28px;
-    pointer-events: none;
-    z-index: 9999 !important;
+    will-change: transform;
+    contain: layout style;
     animation: float 25s infinite ease-in-out;
     filter: brightness(0) invert(1);
     text-shadow: 0 0 15px rgba(255, 255, 255, 0.9), 0 0 25px rgba(255, 255, 255, 0.6);
-    display: block !important;
-    visibility: visible !important;
 }
 
 /* Floating hearts - glowy pink */
 .heart {
-    position: fixed;
+    position: absolute;
     font-size: 28px;
-    pointer-events: none;
-    z-index: 9999 !important;
+    will-change: transform;
+    contain: layout style;
     animation: float 25s infinite ease-in-out;
-    color: #ff69b4 !important;
+    color: #ff69b4;
     text-shadow: 0 0 15px #ff69b4, 0 0 25px #ff1493, 0 0 35px #ff69b4;
-    display: block !important;
-    visibility: visible !important;
 }
 
 @keyframes float {
@@ -713,7 +1335,7 @@ div:has(> #chatbot) > label {
     background: rgba(255, 255, 255, 0.08);
     border-radius: 10px;
     border: 1px solid rgba(255, 255, 255, 0.15);
-    transition: all 0.3s ease;
+    transition: background 0.3s ease, transform 0.3s ease, box-shadow 0.3s ease;
 }
 
 .theme-item:hover {
@@ -828,7 +1450,7 @@ div:has(> #chatbot) > label {
     height: 60px !important;
     cursor: pointer !important;
     border: 3px solid rgba(255, 255, 255, 0.4) !important;
-    transition: all 0.3s ease !important;
+    transition: transform 0.3s ease, border-color 0.3s ease, box-shadow 0.3s ease, filter 0.3s ease !important;
     position: relative !important;
     border-radius: 12px !important;
     box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2), 
@@ -861,7 +1483,7 @@ div:has(> #chatbot) > label {
     font-size: 13px;
     white-space: nowrap;
     opacity: 0;
-    transition: all 0.3s ease;
+    transition: transform 0.3s ease, opacity 0.3s ease;
     pointer-events: none;
     z-index: 1000;
 }
@@ -1005,7 +1627,7 @@ button[role="tab"]:hover {
 }
 
 button[role="tab"][aria-selected="true"] {
-    background: linear-gradient(135deg, #7642a0 0%, #9370DB 100%) !important;
+    background: var(--accent-grad) !important;
     color: white !important;
     box-shadow: 0 4px 12px rgba(118, 66, 160, 0.4) !important;
     transform: scale(1.02) !important;
@@ -1128,7 +1750,7 @@ textarea:focus, input:focus {
 }
 
 button {
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%) !important;
+    background: var(--primary-grad) !important;
     color: white !important;
     border: none !important;
     border-radius: 12px !important;
@@ -1153,7 +1775,7 @@ button:hover {
 }
 
 #quit-btn {
-    background: linear-gradient(135deg, #FFB6C1 0%, #FF91B4 100%) !important;
+    background: var(--quit-grad) !important;
     color: #000000 !important;
     box-shadow: 0 4px 15px rgba(255, 182, 193, 0.4) !important;
 }
@@ -1181,8 +1803,12 @@ button:hover {
     visibility: visible !important;
 }
 
-/* No black borders - use subtle purple everywhere in voice input */
-#mic-input * {
+/* No black borders - use subtle purple on the bordered parts of the voice input */
+#mic-input label,
+#mic-input button,
+#mic-input select,
+#mic-input .audio-container,
+#mic-input .controls {
     border-color: #b8a0e0 !important;
 }
 
@@ -1197,14 +1823,14 @@ button:hover {
 }
 
 #mic-input button {
-    background: linear-gradient(135deg, #e8e0f5 0%, #d8d0e8 100%) !important;
+    background: var(--mic-grad) !important;
     color: #2d3748 !important;
     border: 1px solid #b8a0e0 !important;
     border-radius: 8px !important;
     padding: 8px 16px !important;
     font-weight: 600 !important;
     cursor: pointer !important;
-    transition: all 0.2s ease !important;
+    transition: transform 0.2s ease, box-shadow 0.2s ease !important;
     text-align: center !important;
     display: flex !important;
     align-items: center !important;
@@ -1303,8 +1929,9 @@ button:hover {
     max-width: none !important;
     min-width: 220px !important;
 }
-.stats-bar-box, .login-bar, #stats-bar-left-wrap, #login-bar-wrap {
-    background: linear-gradient(135deg, #7a4a9e 0%, #9b6bb8 100%) !important;
+/* One shared surface on the outer wrappers; the inner stats/login divs stay unpainted */
+.bar-surface {
+    background: var(--bar-grad) !important;
     padding: 12px 18px !important;
     border-radius: 12px !important;
     box-shadow: 0 4px 18px rgba(74, 31, 110, 0.35),
@@ -1319,7 +1946,7 @@ button:hover {
     min-width: 200px !important;
 }
 #login-bar-wrap { width: auto !important; }
-#stats-bar-left-wrap *, #login-bar-wrap *, .stats-bar-box *, .login-bar * {
+.bar-surface * {
     color: #ffffff !important;
 }
 .login-bar a {
@@ -1356,6 +1983,31 @@ footer {
 """
 
 
+_HISTORY_ENTRY_HEADER_TEMPLATE = """
+### {entry_date} ({message_count} messages)
+**Sentiment:** {sentiment} | **Themes:** {themes}{mood}
+
+"""
+
+_HISTORY_MOOD_TEMPLATE = ' | <span style="display: inline-flex; align-items: center; gap: 5px; vertical-align: middle;"><strong>Mood:</strong> <span style="display: inline-block; width: 15px; height: 15px; background: {color}; border-radius: 50%; border: 1px solid rgba(0,0,0,0.2); box-shadow: 0 0 8px {color};"></span>{name}</span>'
+
+MOOD_DEFAULT_COLOR = '#FFFFFF'
+
+# Mood badge markup for each known mood, rendered once instead of per history entry
+_HISTORY_MOOD_HTML = {
+    mood_name: _HISTORY_MOOD_TEMPLATE.format(color=info['color'], name=info['name'])
+    for mood_name, info in MOOD_COLORS.items()
+}
+
+_HISTORY_MESSAGE_TEMPLATE = """
+**You:** {user}
+
+**Luna:** {luna}
+
+---
+"""
+
+
 def format_entry_for_display(entry):
     """Format a single day's journal entry for display"""
     themes_str = ", ".join(entry['themes']) if entry['themes'] else "No themes"
@@ -1365,124 +2017,141 @@ def format_entry_for_display(entry):
     mood_display = ""
     if entry.get('mood_color'):
         mood_name = entry['mood_color'].split(':')[0]
-        mood_info = MOOD_COLORS.get(mood_name, {})
-        mood_name_display = mood_info.get('name', mood_name.title())
-        mood_color_hex = mood_info.get('color', '#FFFFFF')
-        mood_display = f' | <span style="display: inline-flex; align-items: center; gap: 5px; vertical-align: middle;"><strong>Mood:</strong> <span style="display: inline-block; width: 15px; height: 15px; background: {mood_color_hex}; border-radius: 50%; border: 1px solid rgba(0,0,0,0.2); box-shadow: 0 0 8px {mood_color_hex};"></span>{mood_name_display}</span>'
+        mood_display = _HISTORY_MOOD_HTML.get(mood_name) or _HISTORY_MOOD_TEMPLATE.format(
+            color=MOOD_DEFAULT_COLOR, name=mood_name.title()
+        )
     
     # Build conversation display
-    conversation_html = f"""
-### {entry['entry_date']} ({message_count} messages)
-**Sentiment:** {entry['sentiment']} | **Themes:** {themes_str}{mood_display}
-
-"""
+    parts = [_HISTORY_ENTRY_HEADER_TEMPLATE.format(
+        entry_date=entry['entry_date'],
+        message_count=message_count,
+        sentiment=entry['sentiment'],
+        themes=themes_str,
+        mood=mood_display,
+    )]
+    parts.extend(
+        _HISTORY_MESSAGE_TEMPLATE.format(user=msg['user'], luna=msg['luna'])
+        for msg in entry['conversation']
+    )
     
-    for i, msg in enumerate(entry['conversation'], 1):
-        conversation_html += f"""
-**You:** {msg['user']}
+    return "".join(parts)
 
-**Luna:** {msg['luna']}
+HISTORY_LIMIT = 50
 
----
-"""
-    
-    return conversation_html
+# Last loaded history view: entries (most recent first) and their rendered markdown,
+# so a chat turn only re-renders today's entry instead of re-querying every row
+_history_cache = {"entries": None, "blocks": None}
+_history_lock = threading.Lock()
 
-def load_history():
-    """Load and display all entries"""
-    entries = db.get_all_entries(limit=50)
-    
-    if not entries:
+
+def _render_history(blocks):
+    if not blocks:
         return "No entries yet. Start journaling to see your history here!"
     
-    history_text = f"## Your Journal History ({len(entries)} days)\n\n"
-    
-    for entry in entries:
-        history_text += format_entry_for_display(entry)
-    
-    return history_text
+    return "".join([f"## Your Journal History ({len(blocks)} days)\n\n", *blocks])
+
+
+def load_history():
+    """Load and display all entries (full reload from the database)"""
+    entries = db.get_all_entries(limit=HISTORY_LIMIT)
+    blocks = [format_entry_for_display(entry) for entry in entries]
+    with _history_lock:
+        _history_cache["entries"] = entries
+        _history_cache["blocks"] = blocks
+    return _render_history(blocks)
+
+
+def get_history_view():
+    """Return the history view, loading it from the database only if not cached."""
+    with _history_lock:
+        blocks = _history_cache["blocks"]
+        if blocks is not None:
+            return _render_history(blocks)
+    return load_history()
+
+
+def invalidate_history():
+    """Drop the cached history view so the next read reloads it."""
+    with _history_lock:
+        _history_cache["entries"] = None
+        _history_cache["blocks"] = None
+
+
+def append_to_history(entry_id, message, ai_response, analysis, themes, today):
+    """Add a just-saved message to the cached history view without re-querying the database."""
+    message_data = {
+        'user': message,
+        'luna': ai_response,
+        'timestamp': datetime.now().isoformat()
+    }
+    with _history_lock:
+        entries, blocks = _history_cache["entries"], _history_cache["blocks"]
+        if entries is not None:
+            if entries and entries[0]['entry_date'] == today:
+                entries[0]['conversation'].append(message_data)
+            else:
+                entries.insert(0, {
+                    'id': entry_id,
+                    'entry_date': today,
+                    'conversation': [message_data],
+                    'sentiment': analysis['sentiment'],
+                    'sentiment_score': analysis['sentiment_score'],
+                    'themes': themes,
+                    'mood_color': None,
+                    'created_at': message_data['timestamp']
+                })
+                blocks.insert(0, None)
+                del entries[HISTORY_LIMIT:]
+                del blocks[HISTORY_LIMIT:]
+            blocks[0] = format_entry_for_display(entries[0])
+            return _render_history(blocks)
+    return load_history()
 
 def search_history(search_term):
     """Search entries by date or content"""
     if not search_term.strip():
-        return load_history()
+        return get_history_view()
     
     entries = db.search_entries(search_term)
     
     if not entries:
         return f"No entries found matching '{search_term}'"
     
-    history_text = f"## Search Results for '{search_term}' ({len(entries)} days)\n\n"
+    chunks = [f"## Search Results for '{search_term}' ({len(entries)} days)\n\n"]
+    chunks.extend(map(format_entry_for_display, entries))
     
-    for entry in entries:
-        history_text += format_entry_for_display(entry)
-    
-    return history_text
+    return "".join(chunks)
 
-def get_weekly_entries():
-    """Get entries from the past 7 days (only entries with actual journal content)"""
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
-        FROM entries
-        WHERE entry_date >= date('now', '-7 days')
-        AND conversation != '[]'
-        ORDER BY entry_date DESC
-    """)
+def _weekly_wrap_key(entries):
+    """Hash each entry's id + last update; any new message changes the key.
     
-    entries = []
-    for row in cursor.fetchall():
-        entries.append({
-            'id': row[0],
-            'entry_date': row[1],
-            'conversation': json.loads(row[2]),
-            'sentiment': row[3],
-            'sentiment_score': row[4],
-            'themes': json.loads(row[5]) if row[5] else [],
-            'mood_color': row[6],
-            'created_at': row[7]
-        })
-    
-    conn.close()
-    return entries
-
-def generate_weekly_wrap():
-    """Generate a weekly wrap-up of gratitude and learnings"""
-    entries = get_weekly_entries()
-    
-    if not entries:
-        return """
-<div style="text-align: center; padding: 40px 20px;">
+    The DB path is left out on purpose: Drive logins download to a fresh temp file each time,
+    and the wrap is stored in that same DB, so the key must stay stable across sessions.
+    """
+    payload = json.dumps([(e['id'], e['updated_at']) for e in entries])
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
 
-# 💗 Weekly Wrap 💗
 
-<div style="font-size: 48px; margin: 30px 0;">✍🏼</div>
+# Last completed wrap (also persisted in the DB), so revisiting the tab doesn't call the LLM again
+_wrap_cache = {"key": None, "content": None}
+_wrap_lock = threading.Lock()
 
-### No entries found for the past 7 days
 
-<div style="margin: 30px 0; padding: 20px; background: rgba(147, 112, 219, 0.1); border-radius: 15px; border: 1px solid rgba(147, 112, 219, 0.3);">
+def invalidate_wrap():
+    """Drop the in-memory wrap (e.g. after switching between local and Drive databases)."""
+    with _wrap_lock:
+        _wrap_cache["key"] = None
+        _wrap_cache["content"] = None
 
-**Start journaling to see your weekly wrap-up here!**
 
-</div>
-
-*Tip: Journal for at least 3-4 days this week to get meaningful insights!*
-
-</div>
-"""
-    
-    # Compile all conversations from the week
-    all_messages = []
-    for entry in entries:
-        for msg in entry['conversation']:
-            all_messages.append(f"**Date: {entry['entry_date']}**\nYou: {msg['user']}\nLuna: {msg['luna']}\n")
-    
-    week_text = "\n".join(all_messages)
-    
-    # Use Llama to analyze and extract gratitude and learnings
-    try:
+def _stream_wrap(cache_key, week_text):
+    """Yield the growing LLM wrap for this week; served whole from memory or the DB when cached (errors are not cached)."""
+    with _wrap_lock:
+        if _wrap_cache["key"] == cache_key:
+            yield _wrap_cache["content"]
+            return
+    cached = db.get_weekly_wrap(cache_key)
+    if cached is None:
         prompt = f"""Analyze the following week of journal entries and create a warm, personalized weekly wrap-up.
 
 Extract and summarize:
@@ -1506,28 +2175,60 @@ Format your response as:
 
 Be specific and personal. Quote or paraphrase their own words where relevant."""
 
-        response = groq_client.chat.completions.create(
+        stream = groq_client.chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[
                 {"role": "system", "content": "You are Luna, an empathetic journaling companion. Analyze journal entries and create thoughtful weekly summaries."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=1500
+            max_tokens=1500,
+            stream=True
         )
-        
-        wrap_content = response.choices[0].message.content
-        
-        # Check if response contains placeholder text (means not enough content to analyze)
-        if "[List" in wrap_content or "[A short" in wrap_content:
-            days_text = "day" if len(entries) == 1 else "days"
-            return f"""
+
+        wrap_content = ""
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                wrap_content += delta
+                yield wrap_content
+        db.save_weekly_wrap(cache_key, wrap_content)
+    else:
+        wrap_content = cached
+        yield wrap_content
+    with _wrap_lock:
+        _wrap_cache["key"] = cache_key
+        _wrap_cache["content"] = wrap_content
+
+
+# Static Weekly Wrap states, built once (the templates only take the counts/dates/error)
+_EMPTY_WRAP_MD = """
 <div style="text-align: center; padding: 40px 20px;">
 
 # 💗 Weekly Wrap 💗
 
-### {entries[-1]['entry_date']} to {entries[0]['entry_date']}
-*{len(entries)} {days_text} journaled this week*
+<div style="font-size: 48px; margin: 30px 0;">✍🏼</div>
+
+### No entries found for the past 7 days
+
+<div style="margin: 30px 0; padding: 20px; background: rgba(147, 112, 219, 0.1); border-radius: 15px; border: 1px solid rgba(147, 112, 219, 0.3);">
+
+**Start journaling to see your weekly wrap-up here!**
+
+</div>
+
+*Tip: Journal for at least 3-4 days this week to get meaningful insights!*
+
+</div>
+"""
+
+_NOT_ENOUGH_WRAP_TEMPLATE = """
+<div style="text-align: center; padding: 40px 20px;">
+
+# 💗 Weekly Wrap 💗
+
+### {start} to {end}
+*{count} {days_text} journaled this week*
 
 <div style="font-size: 48px; margin: 30px 0;">✍️</div>
 
@@ -1543,21 +2244,8 @@ Your journal entries this week are a great start! However, we need a bit more co
 
 </div>
 """
-        
-        # Add header
-        days_text = "day" if len(entries) == 1 else "days"
-        header = f"""# 💗 Weekly Wrap 💗
-*{entries[-1]['entry_date']} to {entries[0]['entry_date']}*
-*{len(entries)} {days_text} journaled this week*
-
----
 
-"""
-        return header + wrap_content
-        
-    except Exception as e:
-        print(f"Error generating weekly wrap: {e}")
-        return f"""
+_ERROR_WRAP_TEMPLATE = """
 <div style="text-align: center; padding: 40px 20px;">
 
 # 💗 Weekly Wrap 💗
@@ -1568,7 +2256,7 @@ Your journal entries this week are a great start! However, we need a bit more co
 
 <div style="margin: 30px 0; padding: 20px; background: rgba(220, 20, 60, 0.1); border-radius: 15px; border: 1px solid rgba(220, 20, 60, 0.3);">
 
-Found **{len(entries)}** days of entries, but couldn't generate the weekly wrap.
+Found **{count}** days of entries, but couldn't generate the weekly wrap.
 
 **Possible reasons:**
 - API connection issue
@@ -1582,11 +2270,68 @@ Found **{len(entries)}** days of entries, but couldn't generate the weekly wrap.
 
 </div>
 
-*Error details: {str(e)}*
+*Error details: {error}*
 
 </div>
 """
 
+
+def generate_weekly_wrap():
+    """Generate a weekly wrap-up of gratitude and learnings, streaming it in as it's written"""
+    entries = db.get_weekly_entries()
+    
+    if not entries:
+        yield _EMPTY_WRAP_MD
+        return
+    
+    # Compile all conversations from the week
+    all_messages = []
+    for entry in entries:
+        for msg in entry['conversation']:
+            all_messages.append(f"**Date: {entry['entry_date']}**\nYou: {msg['user']}\nLuna: {msg['luna']}\n")
+    
+    week_text = "\n".join(all_messages)
+    
+    # Use Llama to analyze and extract gratitude and learnings (cached until an entry changes)
+    try:
+        days_text = "day" if len(entries) == 1 else "days"
+        header = f"""# 💗 Weekly Wrap 💗
+*{entries[-1]['entry_date']} to {entries[0]['entry_date']}*
+*{len(entries)} {days_text} journaled this week*
+
+---
+
+"""
+        wrap_content = ""
+        for wrap_content in _stream_wrap(_weekly_wrap_key(entries), week_text):
+            yield header + wrap_content
+        
+        # Check if response contains placeholder text (means not enough content to analyze)
+        if "[List" in wrap_content or "[A short" in wrap_content:
+            yield _NOT_ENOUGH_WRAP_TEMPLATE.format(
+                start=entries[-1]['entry_date'], end=entries[0]['entry_date'], count=len(entries), days_text=days_text
+            )
+        
+    except Exception as e:
+        print(f"Error generating weekly wrap: {e}")
+        yield _ERROR_WRAP_TEMPLATE.format(count=len(entries), error=str(e))
+
+def build_flutter_html(count=9):
+    """Pre-render the floating butterflies and hearts (every 3rd is a heart) as static markup."""
+    items = []
+    for i in range(count):
+        kind, glyph = ("heart", "&#x2665;") if i % 3 == 0 else ("butterfly", "&#x1F98B;")
+        style = (
+            f"left:{random.random() * 100:.1f}%;top:{random.random() * 100:.1f}%;"
+            f"animation-delay:{random.random() * 10:.1f}s;animation-duration:{15 + random.random() * 10:.1f}s;"
+            f"opacity:{0.8 + random.random() * 0.2:.2f}"
+        )
+        items.append(f'<div class="{kind}" style="{style}">{glyph}</div>')
+    return f'<div id="flutter-layer">{"".join(items)}</div>'
+
+
+FLUTTER_HTML = build_flutter_html()
+
 # Lavender look: head HTML (butterflies, ripple, background) — also passed to mount_gradio_app when OAuth is on
 custom_head = """
     <style>
@@ -1597,29 +2342,11 @@ custom_head = """
         }
     </style>
     <script>
+        const FLUTTER_HTML = """ + json.dumps(FLUTTER_HTML) + """;
+        
         function createButterflies() {
-            const container = document.body;
-            
-            // Create mix of butterflies and hearts (6 butterflies, 3 hearts)
-            for (let i = 0; i < 9; i++) {
-                const element = document.createElement('div');
-                
-                // Every 3rd item is a heart, rest are butterflies
-                if (i % 3 === 0) {
-                    element.className = 'heart';
-                    element.innerHTML = '&#x2665;'; // Heart symbol
-                } else {
-                    element.className = 'butterfly';
-                    element.innerHTML = '&#x1F98B;'; // Butterfly emoji
-                }
-                
-                element.style.left = Math.random() * 100 + '%';
-                element.style.top = Math.random() * 100 + '%';
-                element.style.animationDelay = Math.random() * 10 + 's';
-                element.style.animationDuration = (15 + Math.random() * 10) + 's';
-                element.style.opacity = 0.8 + Math.random() * 0.2;
-                container.appendChild(element);
-            }
+            if (document.getElementById('flutter-layer')) return;
+            document.body.insertAdjacentHTML('beforeend', FLUTTER_HTML);
         }
         
         // Create butterflies and hearts when page loads
@@ -1629,88 +2356,125 @@ custom_head = """
             createButterflies();
         }
         
-        // Enhanced tab switching with smooth transitions
+        // Enhanced tab switching with smooth transitions; returns false until the tabs are rendered
         function initSmoothTabs() {
-            // Wait for tabs to be rendered
-            setTimeout(() => {
-                const tabs = document.querySelectorAll('button[role="tab"]');
-                const tabPanels = document.querySelectorAll('[role="tabpanel"]');
-                
-                if (tabs.length === 0) return;
-                
-                tabs.forEach((tab, index) => {
-                    tab.addEventListener('click', () => {
-                        // Add ripple effect on click
-                        const ripple = document.createElement('span');
-                        ripple.style.position = 'absolute';
-                        ripple.style.width = '100%';
-                        ripple.style.height = '100%';
-                        ripple.style.background = 'rgba(255, 255, 255, 0.3)';
-                        ripple.style.borderRadius = '10px';
-                        ripple.style.top = '0';
-                        ripple.style.left = '0';
-                        ripple.style.animation = 'ripple 0.6s ease-out';
-                        ripple.style.pointerEvents = 'none';
-                        tab.style.position = 'relative';
-                        tab.appendChild(ripple);
-                        
-                        setTimeout(() => ripple.remove(), 600);
-                        
-                        // Smooth scroll to top when switching tabs
-                        window.scrollTo({ top: 0, behavior: 'smooth' });
-                    });
+            const tabs = document.querySelectorAll('button[role="tab"]');
+            
+            if (tabs.length === 0) return false;
+            
+            tabs.forEach((tab, index) => {
+                tab.addEventListener('click', () => {
+                    // Add ripple effect on click
+                    const ripple = document.createElement('span');
+                    ripple.style.position = 'absolute';
+                    ripple.style.width = '100%';
+                    ripple.style.height = '100%';
+                    ripple.style.background = 'rgba(255, 255, 255, 0.3)';
+                    ripple.style.borderRadius = '10px';
+                    ripple.style.top = '0';
+                    ripple.style.left = '0';
+                    ripple.style.animation = 'ripple 0.6s ease-out';
+                    ripple.style.pointerEvents = 'none';
+                    tab.style.position = 'relative';
+                    tab.appendChild(ripple);
+                    
+                    setTimeout(() => ripple.remove(), 600);
+                    
+                    // Smooth scroll to top when switching tabs
+                    window.scrollTo({ top: 0, behavior: 'smooth' });
                 });
-                
-                // Add ripple animation
-                const style = document.createElement('style');
-                style.textContent = `
-                    @keyframes ripple {
-                        0% {
-                            transform: scale(0);
-                            opacity: 1;
-                        }
-                        100% {
-                            transform: scale(2);
-                            opacity: 0;
-                        }
+            });
+            
+            // Add ripple animation
+            const style = document.createElement('style');
+            style.textContent = `
+                @keyframes ripple {
+                    0% {
+                        transform: scale(0);
+                        opacity: 1;
                     }
-                `;
-                document.head.appendChild(style);
-            }, 500);
-        }
-        
-        // Initialize smooth tabs
-        if (document.readyState === 'loading') {
-            document.addEventListener('DOMContentLoaded', initSmoothTabs);
-        } else {
-            initSmoothTabs();
+                    100% {
+                        transform: scale(2);
+                        opacity: 0;
+                    }
+                }
+            `;
+            document.head.appendChild(style);
+            return true;
         }
         
-        // Fix Voice Input: Gradio shows two "Stop" buttons; relabel the second one as "Clear"
+        // Fix Voice Input: Gradio shows two "Stop" buttons; relabel the second one as "Clear".
+        // Returns false until both buttons are rendered.
         function fixMicInputLabels() {
             const mic = document.getElementById('mic-input');
-            if (!mic) return;
-            const buttons = mic.querySelectorAll('button');
-            let stopCount = 0;
-            buttons.forEach(btn => {
-                const text = (btn.textContent || '').trim();
-                if (text === 'Stop') {
-                    stopCount++;
-                    if (stopCount === 2) {
-                        btn.textContent = 'Clear';
+            if (!mic) return false;
+            const stops = Array.from(mic.querySelectorAll('button'))
+                .filter(btn => (btn.textContent || '').trim() === 'Stop');
+            if (stops.length < 2) return false;
+            stops[1].textContent = 'Clear';
+            return true;
+        }
+        
+        // Watch only the mic component, relabelling whenever a recording renders the buttons again
+        function watchMicInput(mic) {
+            const micObserver = new MutationObserver(() => {
+                micObserver.takeRecords();
+                fixMicInputLabels();
+            });
+            micObserver.observe(mic, { childList: true, subtree: true });
+            fixMicInputLabels();
+        }
+        
+        // Wait for Gradio to render the tabs and the mic component, then stop watching the page;
+        // from then on only #mic-input is observed, so streamed chat tokens don't wake this up
+        function initWhenRendered() {
+            let tabsReady = false;
+            let micWatched = false;
+            const observer = new MutationObserver(() => {
+                observer.takeRecords();
+                tabsReady = tabsReady || initSmoothTabs();
+                if (!micWatched) {
+                    const mic = document.getElementById('mic-input');
+                    if (mic) {
+                        watchMicInput(mic);
+                        micWatched = true;
                     }
                 }
+                if (tabsReady && micWatched) observer.disconnect();
             });
+            observer.observe(document.body, { childList: true, subtree: true });
         }
         if (document.readyState === 'loading') {
-            document.addEventListener('DOMContentLoaded', () => setTimeout(fixMicInputLabels, 800));
+            document.addEventListener('DOMContentLoaded', initWhenRendered);
         } else {
-            setTimeout(fixMicInputLabels, 800);
+            initWhenRendered();
         }
         
     </script>
 """
 
+def minify_css(css):
+    """Strip comments and whitespace from a stylesheet (safe for the plain CSS in this file)."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_head(head):
+    """Drop indentation, blank lines and whole-line comments; newlines are kept so JS semicolon insertion still works."""
+    lines = (line.strip() for line in head.splitlines())
+    return "\n".join(
+        line for line in lines
+        if line and not line.startswith("//") and not (line.startswith("/*") and line.endswith("*/"))
+    )
+
+
+# Ship the CSS/JS compacted; DEBUG=1 keeps them readable in the browser's devtools
+if os.getenv("DEBUG", "0") == "0":
+    custom_css = minify_css(custom_css)
+    custom_head = minify_head(custom_head)
+
 # Build Gradio interface
 with gr.Blocks(
     title="AI Journaling Companion",
@@ -1740,9 +2504,10 @@ with gr.Blocks(
             with gr.Row(elem_id="top-bar-row"):
                 stats_bar_display = gr.Markdown(
                     value=format_stats_bar(),
-                    elem_id="stats-bar-left-wrap"
+                    elem_id="stats-bar-left-wrap",
+                    elem_classes=["bar-surface"]
                 )
-                with gr.Column(elem_id="login-bar-wrap"):
+                with gr.Column(elem_id="login-bar-wrap", elem_classes=["bar-surface"]):
                     login_display = gr.HTML(value=get_login_html(), elem_id="login-bar-inner")
                     logout_btn = gr.Button("Logout", visible=bool(_current_user["email"]), elem_id="logout-btn")
             logout_btn.click(logout_user, outputs=[login_display, logout_btn])
@@ -1790,29 +2555,7 @@ with gr.Blocks(
                 with gr.Column(scale=1):
                     # Analysis Panel (Top Half)
                     analysis_display = gr.Markdown(
-                        """
-                        <div class="analysis-content">
-                        <div class="analysis-section">
-                        <div class="section-header">
-                        <span class="section-icon">🔮</span>
-                        <span class="section-title">Analysis Panel</span>
-                        </div>
-                        <div style="padding: 30px 20px; text-align: center;">
-                        <div style="font-size: 16px; color: rgba(255, 255, 255, 0.9); margin-bottom: 10px;">
-                        <strong>Write your first entry to see the magic!</strong>
-                        </div>
-                        <div style="font-size: 14px; color: rgba(255, 255, 255, 0.7); font-style: italic;">
-                        I'll analyze your:
-                        </div>
-                        <div style="margin-top: 15px; display: flex; flex-direction: column; gap: 8px; align-items: center;">
-                        <div style="color: rgba(255, 255, 255, 0.8);">🎭 Sentiment & Emotions</div>
-                        <div style="color: rgba(255, 255, 255, 0.8);">🏷️ Themes & Topics</div>
-                        <div style="color: rgba(255, 255, 255, 0.8);">💭 Emotional Patterns</div>
-                        </div>
-                        </div>
-                        </div>
-                        </div>
-                        """,
+                        _EMPTY_ANALYSIS_HTML,
                         elem_id="analysis-panel-top"
                     )
                     
@@ -1868,7 +2611,7 @@ with gr.Blocks(
             search_box.submit(search_history, inputs=search_box, outputs=history_display)
         
         # Define Weekly Wrap tab
-        with gr.TabItem("Weekly Wrap"):
+        with gr.TabItem("Weekly Wrap") as weekly_tab:
             gr.Markdown("""
             ## Your Weekly Summary
             
@@ -1878,32 +2621,36 @@ with gr.Blocks(
             weekly_refresh_btn = gr.Button("🔄 Refresh Weekly Wrap", variant="primary", scale=1)
             
             weekly_wrap_display = gr.Markdown(
-                value=generate_weekly_wrap(),
+                value="*Loading your weekly wrap...*",
                 elem_classes="weekly-wrap-section",
                 elem_id="weekly-wrap-tab-content"
             )
             
             # Event handler for weekly wrap
             weekly_refresh_btn.click(generate_weekly_wrap, outputs=weekly_wrap_display)
+            # Generated when the tab is opened (instantly when cached) instead of blocking startup
+            weekly_tab.select(generate_weekly_wrap, outputs=weekly_wrap_display)
     
     # Event handler for microphone - transcribe audio to text
     mic_btn.change(transcribe_audio, inputs=mic_btn, outputs=msg)
     
-    # Event handlers for journal tab - now also updates history and stats
-    msg.submit(chat_interface, [msg, chatbot], [chatbot, analysis_display, history_display, stats_bar_display, stats_sidebar_display])
-    submit_btn.click(chat_interface, [msg, chatbot], [chatbot, analysis_display, history_display, stats_bar_display, stats_sidebar_display])
-    
-    # Clear message box after submission
-    msg.submit(lambda: "", None, msg)
-    submit_btn.click(lambda: "", None, msg)
+    # Event handlers for journal tab - clears the input and updates history and stats in one event
+    chat_outputs = [msg, chatbot, analysis_display, history_display, stats_bar_display, stats_sidebar_display]
+    msg.submit(chat_interface, [msg, chatbot], chat_outputs, concurrency_limit=CHAT_CONCURRENCY, concurrency_id="chat")
+    submit_btn.click(chat_interface, [msg, chatbot], chat_outputs, concurrency_limit=CHAT_CONCURRENCY, concurrency_id="chat")
     
     # Event handlers for color panel
-    color_happy.click(lambda: save_mood_color_handler('happy'), outputs=color_status)
-    color_calm.click(lambda: save_mood_color_handler('calm'), outputs=color_status)
-    color_sad.click(lambda: save_mood_color_handler('sad'), outputs=color_status)
-    color_energetic.click(lambda: save_mood_color_handler('energetic'), outputs=color_status)
-    color_anxious.click(lambda: save_mood_color_handler('anxious'), outputs=color_status)
-    color_angry.click(lambda: save_mood_color_handler('angry'), outputs=color_status)
+    # One shared handler; each button passes its mood name through a constant gr.State
+    mood_buttons = {
+        'happy': color_happy,
+        'calm': color_calm,
+        'sad': color_sad,
+        'energetic': color_energetic,
+        'anxious': color_anxious,
+        'angry': color_angry,
+    }
+    for mood_name, mood_button in mood_buttons.items():
+        mood_button.click(save_mood_color_handler, inputs=gr.State(mood_name), outputs=color_status)
 
 # Mount on FastAPI when Google OAuth enabled (so we can handle /login/callback)
 if _google_oauth_available:
@@ -1912,6 +2659,8 @@ if _google_oauth_available:
 
     app = FastAPI()
 
+    # A plain def on purpose: FastAPI runs it in its threadpool, so the blocking
+    # Drive download never stalls the event loop (uploads run on timer threads)
     @app.get("/login/callback")
     def login_callback(code: str = None):
         if not code:
@@ -1923,6 +2672,9 @@ if _google_oauth_available:
             db.set_db_path(local_path)
             db.set_after_commit(upload_cb)
             db.init_database()
+            invalidate_stats()
+            invalidate_history()
+            invalidate_wrap()
             _current_user["email"] = drive_storage.get_user_email(creds)
             _current_user["upload_cb"] = upload_cb
         except Exception as e:
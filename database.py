@@ -5,28 +5,76 @@ Supports local file or Google Drive-backed storage (path set at runtime).
 
 import sqlite3
 import json
-from datetime import datetime
+import re
+import threading
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
+# orjson (optional) encodes/decodes conversations several times faster than the stdlib;
+# every read and write path uses it, and empty '[]' columns (mood-only days, no themes) skip decoding entirely
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
 # Default local path; can be overridden for Drive-backed storage
 _default_db_path = Path(__file__).parent / "journal_entries.db"
 _db_path = _default_db_path
 _after_commit = None
 
-# for code that references db.DB_PATH (e.g. app.py get_weekly_entries)
+# for code that references db.DB_PATH
 DB_PATH = _default_db_path
 
+# One long-lived connection shared by all threads instead of connect/close on every call.
+# The lock serializes access so one thread's transaction never interleaves with another's.
+_conn = None
+_conn_path = None
+_lock = threading.RLock()
+
+# WAL lets readers run alongside the writer; NORMAL sync skips the per-commit fsync of the journal
+_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA mmap_size=268435456;
+"""
+
 
 def _get_db_path():
     """Return the current database path (local or Drive-synced temp file)."""
     return _db_path
 
 
+def _get_conn():
+    """Return the shared connection to the current database, opening it if needed (call with _lock held)."""
+    global _conn, _conn_path
+    path = _get_db_path()
+    if _conn is None or _conn_path != path:
+        if _conn is not None:
+            _conn.close()
+        _conn = sqlite3.connect(path, check_same_thread=False)
+        _conn.executescript(_PRAGMAS)
+        _conn_path = path
+    return _conn
+
+
 def set_db_path(path):
     """Set the database path (e.g. to a temp file synced with Google Drive)."""
-    global _db_path, DB_PATH
-    _db_path = Path(path) if path else _default_db_path
-    DB_PATH = _db_path
+    global _db_path, DB_PATH, _conn, _conn_path
+    with _lock:
+        _db_path = Path(path) if path else _default_db_path
+        DB_PATH = _db_path
+        # Release the old file now; the next call opens the new one
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+            _conn_path = None
 
 
 def set_after_commit(callback):
@@ -45,248 +93,383 @@ def _notify_after_commit():
 
 def init_database():
     """Initialize the database with required tables"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            entry_date DATE NOT NULL UNIQUE,
-            conversation TEXT NOT NULL,
-            overall_sentiment TEXT,
-            sentiment_score REAL,
-            themes TEXT,
-            mood_color TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized")
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                entry_date DATE NOT NULL UNIQUE,
+                conversation TEXT NOT NULL,
+                overall_sentiment TEXT,
+                sentiment_score REAL,
+                themes TEXT,
+                mood_color TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Last generated weekly wrap, so a restart doesn't need another LLM call
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS weekly_wrap_cache (
+                cache_key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Partial indexes matching the stats/weekly predicates, so they don't scan every row
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_entries_has_conv'")
+        indexes_existed = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_entries_sentiment
+            ON entries(overall_sentiment) WHERE overall_sentiment IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_entries_has_conv
+            ON entries(entry_date) WHERE conversation != '[]'
+        """)
+        
+        _init_search_index(cursor)
+        
+        conn.commit()
+        # Planner statistics: a full ANALYZE only when the indexes are new, otherwise
+        # PRAGMA optimize, which re-analyzes only tables whose stats have gone stale
+        cursor.execute("PRAGMA optimize" if indexes_existed else "ANALYZE")
+        print("✅ Database initialized")
+
+
+# Full-text index over conversations/themes, kept in sync with entries by triggers
+_FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE entries_fts USING fts5(
+        conversation, themes, content='entries', content_rowid='id', tokenize='porter unicode61'
+    );
+    CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts(rowid, conversation, themes) VALUES (new.id, new.conversation, new.themes);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, conversation, themes) VALUES ('delete', old.id, old.conversation, old.themes);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_au AFTER UPDATE OF conversation, themes ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, conversation, themes) VALUES ('delete', old.id, old.conversation, old.themes);
+        INSERT INTO entries_fts(rowid, conversation, themes) VALUES (new.id, new.conversation, new.themes);
+    END;
+    INSERT INTO entries_fts(entries_fts) VALUES ('rebuild');
+"""
+
+# Set per database by init_database; False when this SQLite build lacks FTS5 (search falls back to LIKE)
+_fts_available = False
 
 
-def save_conversation_message(user_message, ai_response, sentiment, sentiment_score, themes):
+# Index built before stemming was enabled; dropped and rebuilt with the current schema
+_DROP_FTS = """
+    DROP TRIGGER IF EXISTS entries_fts_ai;
+    DROP TRIGGER IF EXISTS entries_fts_ad;
+    DROP TRIGGER IF EXISTS entries_fts_au;
+    DROP TABLE IF EXISTS entries_fts;
+"""
+
+
+def _init_search_index(cursor):
+    """Create the FTS5 index (indexing existing rows) if this database doesn't have an up-to-date one."""
+    global _fts_available
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'")
+    existing = cursor.fetchone()
+    if existing and "porter" in existing[0]:
+        _fts_available = True
+        return
+    try:
+        if existing:
+            cursor.connection.executescript(_DROP_FTS)
+        cursor.connection.executescript(_FTS_SCHEMA)
+        _fts_available = True
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Full-text search unavailable, using LIKE search: {e}")
+        _fts_available = False
+
+
+# Hot-path SQL kept as constants so sqlite3's statement cache reuses the prepared statements.
+# Messages are appended inside SQLite (json_insert) so the day's history is never decoded and
+# re-encoded in Python. Update first and insert only when no row matched: an upsert would burn
+# an AUTOINCREMENT value on every conflict, leaving gaps in the entry ids.
+_SQL_APPEND_MESSAGE = """
+    UPDATE entries
+    SET conversation = json_insert(conversation, '$[#]', json(?)), updated_at = CURRENT_TIMESTAMP
+    WHERE entry_date = ?
+"""
+_SQL_INSERT_NEW = """
+    INSERT INTO entries (entry_date, conversation, overall_sentiment, sentiment_score, themes)
+    VALUES (?, ?, ?, ?, ?)
+"""
+_SQL_SELECT_TODAY_ID = "SELECT id FROM entries WHERE entry_date = ?"
+
+
+def save_conversation_message(user_message, ai_response, sentiment, sentiment_score, themes, today=None):
     """Save or append to today's journal entry"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
+    return save_conversation_messages([{
+        'user_message': user_message,
+        'ai_response': ai_response,
+        'sentiment': sentiment,
+        'sentiment_score': sentiment_score,
+        'themes': themes
+    }], today=today)
+
+
+def save_conversation_messages(messages, today=None):
+    """Append several messages to today's entry in one transaction (one Drive sync); returns the entry id.
     
-    # today's date
-    today = datetime.now().date().isoformat()
+    Each message is a dict with the save_conversation_message arguments; a new entry takes its
+    sentiment and themes from the first message. Callers that already know today's ISO date
+    can pass it as ``today``. An empty batch writes nothing and returns None.
+    """
+    if not messages:
+        return None
     
-    # checking if entry exists for today
-    cursor.execute("SELECT id, conversation FROM entries WHERE entry_date = ?", (today,))
-    existing = cursor.fetchone()
+    # One clock read: the date is the timestamp's YYYY-MM-DD prefix
+    timestamp = datetime.now().isoformat()
+    today = today or timestamp[:10]
     
-    # Create conversation message
-    message_data = {
-        'user': user_message,
-        'luna': ai_response,
-        'timestamp': datetime.now().isoformat()
-    }
+    # Only the new messages are encoded
+    new_messages = [
+        _json_dumps({'user': m['user_message'], 'luna': m['ai_response'], 'timestamp': timestamp})
+        for m in messages
+    ]
     
-    if existing:
-        # Append to existing entry
-        entry_id = existing[0]
-        conversation = json.loads(existing[1])
-        conversation.append(message_data)
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
         
-        # Update conversation and timestamp
-        cursor.execute("""
-            UPDATE entries 
-            SET conversation = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (json.dumps(conversation), entry_id))
-    else:
-        # Create new entry for today
-        conversation = [message_data]
-        themes_json = json.dumps(themes)
-        
-        cursor.execute("""
-            INSERT INTO entries (entry_date, conversation, overall_sentiment, sentiment_score, themes)
-            VALUES (?, ?, ?, ?, ?)
-        """, (today, json.dumps(conversation), sentiment, sentiment_score, themes_json))
+        cursor.execute(_SQL_APPEND_MESSAGE, (new_messages[0], today))
+        if cursor.rowcount == 0:
+            # No entry yet today: create it with the whole batch and the first message's sentiment/themes
+            first = messages[0]
+            cursor.execute(_SQL_INSERT_NEW, (
+                today, "[" + ",".join(new_messages) + "]",
+                first['sentiment'], first['sentiment_score'], _json_dumps(first['themes'])
+            ))
+            entry_id = cursor.lastrowid
+        else:
+            cursor.executemany(_SQL_APPEND_MESSAGE, [(message, today) for message in new_messages[1:]])
+            cursor.execute(_SQL_SELECT_TODAY_ID, (today,))
+            entry_id = cursor.fetchone()[0]
         
-        entry_id = cursor.lastrowid
-    
-    conn.commit()
+        conn.commit()
     _notify_after_commit()
-    conn.close()
     
     return entry_id
 
 
+def _row_to_entry(row, _loads=_json_loads):
+    """Entry dict for an (id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at) row."""
+    conversation = row[2]
+    themes = row[5]
+    return {
+        'id': row[0],
+        'entry_date': row[1],
+        'conversation': _loads(conversation) if conversation != '[]' else [],
+        'sentiment': row[3],
+        'sentiment_score': row[4],
+        'themes': _loads(themes) if themes and themes != '[]' else [],
+        'mood_color': row[6],
+        'created_at': row[7]
+    }
+
+
 def get_all_entries(limit=100):
     """Get all journal entries, most recent first"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
-        FROM entries
-        ORDER BY entry_date DESC
-        LIMIT ?
-    """, (limit,))
-    
-    entries = []
-    for row in cursor.fetchall():
-        entries.append({
-            'id': row[0],
-            'entry_date': row[1],
-            'conversation': json.loads(row[2]),
-            'sentiment': row[3],
-            'sentiment_score': row[4],
-            'themes': json.loads(row[5]) if row[5] else [],
-            'mood_color': row[6],
-            'created_at': row[7]
-        })
-    
-    conn.close()
-    return entries
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
+            FROM entries
+            ORDER BY entry_date DESC
+            LIMIT ?
+        """, (limit,))
+        
+        return [_row_to_entry(row) for row in cursor]
 
 def get_entry_by_date(entry_date):
     """Get a specific entry by date"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
-        FROM entries
-        WHERE entry_date = ?
-    """, (entry_date,))
-    
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            'id': row[0],
-            'entry_date': row[1],
-            'conversation': json.loads(row[2]),
-            'sentiment': row[3],
-            'sentiment_score': row[4],
-            'themes': json.loads(row[5]) if row[5] else [],
-            'mood_color': row[6],
-            'created_at': row[7]
-        }
-    return None
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
+            FROM entries
+            WHERE entry_date = ?
+        """, (entry_date,))
+        
+        row = cursor.fetchone()
+        
+        return _row_to_entry(row) if row else None
+
+# Constant SQL text so sqlite3's statement cache reuses the prepared statement
+_WEEKLY_ENTRIES_SQL = """
+    SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at, updated_at
+    FROM entries
+    WHERE entry_date >= ?
+    AND conversation != '[]'
+    ORDER BY entry_date DESC
+"""
+
+
+def get_weekly_entries():
+    """Get entries from the past 7 days (only entries with actual journal content)"""
+    with _lock:
+        conn = _get_conn()
+        
+        # Cutoff computed once in local time, matching how entry_date is written
+        cutoff = (date.today() - timedelta(days=7)).isoformat()
+        
+        entries = []
+        for row in conn.execute(_WEEKLY_ENTRIES_SQL, (cutoff,)):
+            entry = _row_to_entry(row)
+            entry['updated_at'] = row[8]
+            entries.append(entry)
+        
+        return entries
+
+# Every scalar stat in one statement; each subquery is answered from a partial index
+# (the sentiment breakdown is the only separate query)
+_SQL_STATS = """
+    SELECT (SELECT COUNT(*) FROM entries WHERE conversation != '[]'),
+           (SELECT AVG(sentiment_score) FROM entries WHERE overall_sentiment = 'positive'),
+           (SELECT MAX(entry_date) FROM entries WHERE conversation != '[]')
+"""
+_SQL_SENTIMENT_COUNTS = """
+    SELECT overall_sentiment, COUNT(*) FROM entries
+    WHERE overall_sentiment IS NOT NULL GROUP BY overall_sentiment
+"""
 
 def get_stats():
     """Get statistics about journal entries"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    # Total days with actual journal entries (not just mood colors)
-    cursor.execute("SELECT COUNT(*) FROM entries WHERE conversation != '[]'")
-    total_entries = cursor.fetchone()[0]
-    
-    # Average sentiment
-    cursor.execute("SELECT AVG(sentiment_score) FROM entries WHERE overall_sentiment = 'positive'")
-    avg_positive = cursor.fetchone()[0] or 0
-    
-    # Count by sentiment (only entries with conversations)
-    cursor.execute("SELECT overall_sentiment, COUNT(*) FROM entries WHERE overall_sentiment IS NOT NULL GROUP BY overall_sentiment")
-    sentiment_counts = {}
-    for row in cursor.fetchall():
-        if row[0]:
-            sentiment_counts[row[0].upper()] = row[1]
-    
-    # Most recent entry date
-    cursor.execute("SELECT MAX(entry_date) FROM entries WHERE conversation != '[]'")
-    last_entry = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return {
-        'total_entries': total_entries,
-        'avg_positive': avg_positive,
-        'sentiment_counts': sentiment_counts,
-        'last_entry': last_entry
-    }
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        # Total days with actual journal entries (not just mood colors), average
+        # positive sentiment and most recent entry date
+        total_entries, avg_positive, last_entry = cursor.execute(_SQL_STATS).fetchone()
+        
+        # Count by sentiment (only entries with conversations)
+        sentiment_counts = {}
+        for row in cursor.execute(_SQL_SENTIMENT_COUNTS):
+            if row[0]:
+                sentiment_counts[row[0].upper()] = row[1]
+        
+        return {
+            'total_entries': total_entries,
+            'avg_positive': avg_positive or 0,
+            'sentiment_counts': sentiment_counts,
+            'last_entry': last_entry
+        }
 
 def delete_entry(entry_id):
     """Delete an entry by ID"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
-    
-    conn.commit()
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        cursor.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+        
+        conn.commit()
     _notify_after_commit()
-    conn.close()
+
+def _fts_query(search_term):
+    """Turn free text into an FTS5 query: every word must appear, as a word or word prefix."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", search_term))
+
 
 def search_entries(search_term):
     """Search entries by text or date"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
-        FROM entries
-        WHERE entry_date LIKE ? OR conversation LIKE ?
-        ORDER BY entry_date DESC
-    """, (f'%{search_term}%', f'%{search_term}%'))
-    
-    entries = []
-    for row in cursor.fetchall():
-        entries.append({
-            'id': row[0],
-            'entry_date': row[1],
-            'conversation': json.loads(row[2]),
-            'sentiment': row[3],
-            'sentiment_score': row[4],
-            'themes': json.loads(row[5]) if row[5] else [],
-            'mood_color': row[6],
-            'created_at': row[7]
-        })
-    
-    conn.close()
-    return entries
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        fts_query = _fts_query(search_term) if _fts_available else ""
+        if fts_query:
+            cursor.execute("""
+                SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
+                FROM entries
+                WHERE entry_date LIKE ?
+                OR id IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)
+                ORDER BY entry_date DESC
+            """, (f'%{search_term}%', fts_query))
+        else:
+            cursor.execute("""
+                SELECT id, entry_date, conversation, overall_sentiment, sentiment_score, themes, mood_color, created_at
+                FROM entries
+                WHERE entry_date LIKE ? OR conversation LIKE ?
+                ORDER BY entry_date DESC
+            """, (f'%{search_term}%', f'%{search_term}%'))
+        
+        return [_row_to_entry(row) for row in cursor]
 
-def save_mood_color(color):
+def save_mood_color(color, today=None):
     """Save or update mood color for today's date"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
-    
-    # Get today's date
-    today = datetime.now().date().isoformat()
-    
-    # Check if entry exists for today
-    cursor.execute("SELECT id FROM entries WHERE entry_date = ?", (today,))
-    existing = cursor.fetchone()
+    today = today or date.today().isoformat()
     
-    if existing:
-        # Update existing entry
-        cursor.execute("""
-            UPDATE entries 
-            SET mood_color = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE entry_date = ?
-        """, (color, today))
-    else:
-        # Create new entry with just the color
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        # Create today's entry with just the color, or set the color on the existing one
         cursor.execute("""
             INSERT INTO entries (entry_date, conversation, mood_color)
-            VALUES (?, ?, ?)
-        """, (today, json.dumps([]), color))
-    
-    conn.commit()
+            VALUES (?, '[]', ?)
+            ON CONFLICT(entry_date) DO UPDATE SET
+                mood_color = excluded.mood_color,
+                updated_at = CURRENT_TIMESTAMP
+        """, (today, color))
+        
+        conn.commit()
     _notify_after_commit()
-    conn.close()
     return True
 
 
-def get_mood_color_for_today():
+def get_mood_color_for_today(today=None):
     """Get the mood color for today's date"""
-    conn = sqlite3.connect(_get_db_path())
-    cursor = conn.cursor()
+    today = today or date.today().isoformat()
     
-    today = datetime.now().date().isoformat()
-    cursor.execute("SELECT mood_color FROM entries WHERE entry_date = ?", (today,))
-    result = cursor.fetchone()
-    
-    conn.close()
-    return result[0] if result and result[0] else None
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT mood_color FROM entries WHERE entry_date = ?", (today,))
+        result = cursor.fetchone()
+        
+        return result[0] if result and result[0] else None
+
+def get_weekly_wrap(cache_key):
+    """Get the stored weekly wrap for this cache key, if any"""
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT content FROM weekly_wrap_cache WHERE cache_key = ?", (cache_key,))
+        result = cursor.fetchone()
+        
+        return result[0] if result else None
+
+
+def save_weekly_wrap(cache_key, content):
+    """Store the weekly wrap, replacing any older one"""
+    with _lock:
+        conn = _get_conn()
+        cursor = conn.cursor()
+        
+        # Only the latest wrap can ever be a hit again
+        cursor.execute("DELETE FROM weekly_wrap_cache")
+        cursor.execute("INSERT INTO weekly_wrap_cache (cache_key, content) VALUES (?, ?)", (cache_key, content))
+        
+        conn.commit()
+    _notify_after_commit()
+
 
 # Initialize database on import
 init_database()
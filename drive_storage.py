@@ -5,13 +5,27 @@ Uses OAuth 2.0 and Drive API to store one SQLite file per user in their Drive.
 
 import os
 import io
+import atexit
+import base64
+import functools
+import hashlib
+import sqlite3
 import tempfile
+import threading
 from pathlib import Path
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 
 # Scopes: only access files created by this app
@@ -19,6 +33,26 @@ SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 # App data folder name in Drive (user-visible as "Luna Journal")
 APP_FOLDER_NAME = "Luna Journal"
 DB_FILENAME = "luna_journal.db"
+# Writes within this many seconds of each other are sent to Drive as one upload
+UPLOAD_DEBOUNCE_SECONDS = 3.0
+# Transfer chunk size; files up to RESUMABLE_THRESHOLD go up in a single request
+TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+
+# Flush for the most recent uploader; one atexit hook serves every login
+_exit_flush = {"fn": None}
+_exit_flush_lock = threading.Lock()
+
+
+def _flush_at_exit():
+    """Push the current session's last write to Drive before the interpreter exits."""
+    with _exit_flush_lock:
+        flush = _exit_flush["fn"]
+    if flush is not None:
+        flush()
+
+
+atexit.register(_flush_at_exit)
 
 
 def get_flow(redirect_uri):
@@ -63,33 +97,51 @@ def exchange_code_for_credentials(code, redirect_uri):
 
 
 def _get_drive_service(creds):
-    return build("drive", "v3", credentials=creds)
+    # The discovery cache only logs warnings with oauth2client missing; skip it
+    return build("drive", "v3", credentials=creds, cache_discovery=False)
+
 
+def _q_string(value):
+    """Quote a value for a Drive search query (backslash-escape \\ and ')."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
 
-def _find_or_create_app_folder(service):
-    """Find or create the app folder in user's Drive. Returns folder ID."""
-    # List files in Drive root, look for folder named APP_FOLDER_NAME
+
+def _find_or_create_app_files(service):
+    """Find (or create) the app folder and its DB file with one list call. Returns (folder_id, file_id or None)."""
+    # drive.file only exposes files this app created, so the combined listing stays small
     results = (
         service.files()
         .list(
-            q="mimeType='application/vnd.google-apps.folder' and name='"
-            + APP_FOLDER_NAME
-            + "' and trashed=false",
+            q=(
+                f"((mimeType='application/vnd.google-apps.folder' and name={_q_string(APP_FOLDER_NAME)})"
+                f" or name={_q_string(DB_FILENAME)}) and trashed=false"
+            ),
             spaces="drive",
-            fields="files(id, name)",
+            fields="files(id, mimeType, parents)",
+            pageSize=100,
         )
         .execute()
     )
     files = results.get("files", [])
-    if files:
-        return files[0]["id"]
+    folder_id = next(
+        (f["id"] for f in files if f["mimeType"] == "application/vnd.google-apps.folder"), None
+    )
+    if folder_id:
+        file_id = next(
+            (
+                f["id"] for f in files
+                if f["mimeType"] != "application/vnd.google-apps.folder" and folder_id in f.get("parents", [])
+            ),
+            None,
+        )
+        return folder_id, file_id
     # Create folder
     file_metadata = {
         "name": APP_FOLDER_NAME,
         "mimeType": "application/vnd.google-apps.folder",
     }
     folder = service.files().create(body=file_metadata, fields="id").execute()
-    return folder["id"]
+    return folder["id"], None
 
 
 def _find_db_file_in_folder(service, folder_id):
@@ -97,9 +149,10 @@ def _find_db_file_in_folder(service, folder_id):
     results = (
         service.files()
         .list(
-            q=f"'{folder_id}' in parents and name='{DB_FILENAME}' and trashed=false",
+            q=f"{_q_string(folder_id)} in parents and name={_q_string(DB_FILENAME)} and trashed=false",
             spaces="drive",
-            fields="files(id, name)",
+            fields="files(id)",
+            pageSize=1,
         )
         .execute()
     )
@@ -107,16 +160,44 @@ def _find_db_file_in_folder(service, folder_id):
     return files[0]["id"] if files else None
 
 
+def _checkpoint(local_path):
+    """Fold the SQLite WAL into the main file so the uploaded .db contains every commit."""
+    conn = sqlite3.connect(str(local_path))
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def _file_digest(path):
+    """blake2b of the file contents, read in chunks."""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def _db_media(local_path):
+    """Upload body for the local DB; small files skip the extra round trip that opens a resumable session."""
+    return MediaFileUpload(
+        str(local_path),
+        mimetype="application/x-sqlite3",
+        chunksize=TRANSFER_CHUNK_SIZE,
+        resumable=local_path.stat().st_size > RESUMABLE_THRESHOLD,
+    )
+
+
 def get_or_create_db_file(creds):
     """
     Ensure the user's Drive has a luna_journal.db file (create empty if not).
     Returns (local_path, upload_callback).
     - local_path: path to a temp file that can be used as SQLite DB.
-    - upload_callback: call this after any DB write to sync back to Drive.
+    - upload_callback: call this after any DB write to sync back to Drive
+      (debounced; skipped when the file is unchanged since the last upload).
     """
     service = _get_drive_service(creds)
-    folder_id = _find_or_create_app_folder(service)
-    file_id = _find_db_file_in_folder(service, folder_id)
+    folder_id, file_id = _find_or_create_app_files(service)
 
     fd, local_path = tempfile.mkstemp(suffix=".db")
     os.close(fd)
@@ -126,7 +207,7 @@ def get_or_create_db_file(creds):
         # Download existing DB to temp file
         request = service.files().get_media(fileId=file_id)
         with open(local_path, "wb") as fh:
-            downloader = MediaIoBaseDownload(fh, request)
+            downloader = MediaIoBaseDownload(fh, request, chunksize=TRANSFER_CHUNK_SIZE)
             done = False
             while not done:
                 status, done = downloader.next_chunk()
@@ -134,31 +215,90 @@ def get_or_create_db_file(creds):
         # Create empty file; we'll upload after first write (init_database will create tables)
         local_path.touch()
 
-    def upload_to_drive():
-        """Upload current local DB back to Drive."""
+    # Drive file id, contents last known to be on Drive, and the pending debounced upload
+    state = {"file_id": file_id, "digest": _file_digest(local_path) if file_id else None, "timer": None}
+    lock = threading.Lock()
+    # The Drive service object isn't thread-safe, so uploads run one at a time
+    upload_lock = threading.Lock()
+
+    def upload_now():
+        """Upload current local DB back to Drive, unless it matches the last upload."""
+        with lock:
+            state["timer"] = None
         if not local_path.exists():
             return
-        file_id = _find_db_file_in_folder(service, folder_id)
-        media = MediaFileUpload(str(local_path), mimetype="application/x-sqlite3", resumable=True)
-        if file_id:
-            service.files().update(fileId=file_id, media_body=media).execute()
-        else:
-            file_metadata = {"name": DB_FILENAME, "parents": [folder_id]}
-            service.files().create(body=file_metadata, media_body=media, fields="id").execute()
+        with upload_lock:
+            try:
+                _checkpoint(local_path)
+                digest = _file_digest(local_path)
+                if digest == state["digest"]:
+                    return
+                file_id = state["file_id"]
+                if file_id:
+                    try:
+                        service.files().update(fileId=file_id, media_body=_db_media(local_path)).execute()
+                    except HttpError as e:
+                        if e.resp.status != 404:
+                            raise
+                        # Deleted or moved on Drive since we cached its id; look it up again
+                        file_id = _find_db_file_in_folder(service, folder_id)
+                        if file_id:
+                            service.files().update(fileId=file_id, media_body=_db_media(local_path)).execute()
+                if not file_id:
+                    file_metadata = {"name": DB_FILENAME, "parents": [folder_id]}
+                    created = (
+                        service.files()
+                        .create(body=file_metadata, media_body=_db_media(local_path), fields="id")
+                        .execute()
+                    )
+                    file_id = created["id"]
+                state["file_id"] = file_id
+                state["digest"] = digest
+            except Exception as e:
+                print(f"⚠️ Drive upload failed: {e}")
+
+    def upload_to_drive():
+        """Schedule an upload on a background timer; each new write restarts the countdown."""
+        with lock:
+            if state["timer"] is not None:
+                state["timer"].cancel()
+            state["timer"] = threading.Timer(UPLOAD_DEBOUNCE_SECONDS, upload_now)
+            state["timer"].daemon = True
+            state["timer"].start()
+
+    def flush():
+        """Upload right away instead of waiting out the debounce.
+        
+        Waits for an in-flight upload (upload_lock) and is a no-op when Drive already has these contents.
+        """
+        with lock:
+            if state["timer"] is not None:
+                state["timer"].cancel()
+        upload_now()
+
+    # Replace the previous login's flush, finishing its pending write first
+    with _exit_flush_lock:
+        previous, _exit_flush["fn"] = _exit_flush["fn"], flush
+    if previous is not None:
+        previous()
 
     return local_path, upload_to_drive
 
 
+@functools.lru_cache(maxsize=64)
+def _email_from_id_token(id_token):
+    """Decode the JWT payload once per token; None if it can't be read."""
+    try:
+        payload = id_token.split(".")[1]
+        data = _json_loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return data.get("email") or data.get("sub")
+    except Exception:
+        return None
+
+
 def get_user_email(creds):
     """Get the user's email from the token info (optional; for display)."""
-    if hasattr(creds, "id_token") and creds.id_token:
-        import base64
-        import json
-        try:
-            payload = creds.id_token.split(".")[1]
-            payload += "=" * (4 - len(payload) % 4)
-            data = json.loads(base64.urlsafe_b64decode(payload))
-            return data.get("email") or data.get("sub", "Signed in with Google")
-        except Exception:
-            pass
+    id_token = getattr(creds, "id_token", None)
+    if id_token:
+        return _email_from_id_token(id_token) or "Signed in with Google"
     return "Signed in with Google"